@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# stitch the screenshots of every crawled site (-0.png, -1.png, ...)
+# together horizontally for labeling, like
+#
+#   convert "{prefix}*.png" +append "{working}/{prefix}combined.png"
+#
+# but in one pool of worker processes instead of forking ImageMagick for
+# every site. every screenshot is decoded once and sites whose combined
+# image is newer than their screenshots are skipped, so this can be rerun
+# after the crawler added more sites.
+#
+#   ./stitch-images.py output-2023-02-01 working-2023-02-01 --workers 8
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import re
+import sys
+
+import cv2
+import numpy as np
+
+# 1000-https!www.michaels.com-20230201081615250-0.png -> (1000-https!www.michaels.com-20230201081615250-, 0)
+SCREENSHOT_RE = re.compile(r'^(.*-)(\d+)\.png$')
+
+PNG_COMPRESSION = 3   # 0 (fastest, biggest) to 9 (slowest, smallest)
+BACKGROUND = 255      # shorter screenshots are padded at the bottom, white like ImageMagick
+
+def site_screenshots(datadir):
+    # yields (prefix, [screenshot paths in index order]) for every site.
+    # only the file names are listed, the images are read by the workers
+    screenshots = sorted((match.group(1), int(match.group(2)), entry.name) for entry in os.scandir(datadir)
+                         for match in [SCREENSHOT_RE.match(entry.name)] if match and entry.is_file())
+    for prefix, group in itertools.groupby(screenshots, key=lambda screenshot: screenshot[0]):
+        yield prefix, [os.path.join(datadir, name) for _, _, name in group]
+
+def combined_path(working, prefix):
+    return os.path.join(working, prefix + 'combined.png')
+
+def up_to_date(output, inputs):
+    try:
+        output_mtime = os.stat(output).st_mtime_ns
+    except OSError:
+        return False
+    return all(os.stat(path).st_mtime_ns <= output_mtime for path in inputs)
+
+def stitch(images):
+    height = max(image.shape[0] for image in images)
+    padded = [cv2.copyMakeBorder(image, 0, height - image.shape[0], 0, 0, cv2.BORDER_CONSTANT, value=(BACKGROUND,) * 3) for image in images]
+    return np.hstack(padded)
+
+def stitch_site(task):
+    # returns (output, status, error), status is 'stitched', 'up-to-date' or 'failed'
+    inputs, output, compression, force = task
+    if not force and up_to_date(output, inputs):
+        return (output, 'up-to-date', None)
+
+    # the crawler's screenshots are RGBA, IMREAD_COLOR drops the alpha
+    # channel (always opaque) like the old convert +append output
+    images = [cv2.imread(path, cv2.IMREAD_COLOR) for path in inputs]
+    unreadable = [path for path, image in zip(inputs, images) if image is None]
+    if unreadable:
+        return (output, 'failed', "can't read %s" % ', '.join(unreadable))
+
+    # written next to the output and renamed, so a killed run never leaves
+    # a truncated combined.png that looks up to date. the temporary file
+    # doesn't end in .png, Simplabel would load a leftover one for labeling
+    tmp_output = output + '.tmp'
+    try:
+        ok, encoded = cv2.imencode('.png', stitch(images), [cv2.IMWRITE_PNG_COMPRESSION, compression])
+        if not ok:
+            return (output, 'failed', "can't encode %s" % output)
+        with open(tmp_output, 'wb') as f:
+            f.write(encoded)
+        os.replace(tmp_output, output)
+    except (OSError, cv2.error) as e:
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+        return (output, 'failed', str(e))
+    return (output, 'stitched', None)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("datadir", type=str, help="Crawler output directory with the -0.png / -1.png screenshots")
+    parser.add_argument("working", type=str, help="Directory the -combined.png images are written to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--compression", type=int, default=PNG_COMPRESSION, choices=range(10), help="PNG compression level, 0 (fastest) to 9 (smallest). Default: %d" % PNG_COMPRESSION)
+    parser.add_argument("--force", help="Stitch every site again, even if its combined image is up to date", action="store_true")
+    args = parser.parse_args()
+
+    os.makedirs(args.working, exist_ok=True)
+
+    tasks = ((inputs, combined_path(args.working, prefix), args.compression, args.force) for prefix, inputs in site_screenshots(args.datadir))
+
+    counts = {'stitched': 0, 'up-to-date': 0, 'failed': 0}
+    with multiprocessing.Pool(args.workers) as pool:
+        for output, status, error in pool.imap_unordered(stitch_site, tasks, chunksize=8):
+            counts[status] += 1
+            if error:
+                sys.stderr.write("%s: %s\n" % (output, error))
+
+    sys.stderr.write("%(stitched)d stitched, %(up-to-date)d up to date, %(failed)d failed\n" % counts)
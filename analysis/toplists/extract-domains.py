@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+# get just the domain + public suffix of the top N sites of the CrUX and/or
+# Tranco lists, in one pass over each list:
+#
+#   ./extract-domains.py --top 1000 --crux ../data/crux/202212.csv --tranco ../data/tranco/top-1m.csv --output temp-{list}.txt
+#
+# the lists are read line by line (.gz too) and reading stops at the first
+# site below the top N, so the full 1M lists are never loaded. CrUX ranks
+# are buckets (1000, 5000, 10000, ...) and the list is sorted by them,
+# --top 1000 is the 1000 bucket. Tranco ranks are exact, --top 1000 is the
+# first 1000 lines. domains are deduplicated as they come, so memory grows
+# with the number of distinct domains written, not with the list size.
+
+import argparse
+import sys
+
+from toplists import LISTS, extract_domains, registered_domain
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=1000, help="Rank to stop at (default: 1000). For CrUX this is the rank bucket.")
+    parser.add_argument("--crux", type=str, help="CrUX list (origin,rank), e.g. ../data/crux/202212.csv")
+    parser.add_argument("--tranco", type=str, help="Tranco list (rank,domain), e.g. ../data/tranco/top-1m.csv")
+    parser.add_argument("--output", type=str, help="Write every list to this file, {list} is replaced by crux or tranco. Default: stdout, as list,domain lines if both lists are given.")
+    parser.add_argument("--sort", help="Sort the domains instead of keeping them in rank order", action="store_true")
+    args = parser.parse_args()
+
+    lists = [(name, path) for name, path in [('crux', args.crux), ('tranco', args.tranco)] if path]
+    if not lists:
+        parser.error("give --crux and/or --tranco")
+
+    for name, path in lists:
+        domains = (domain for _, domain in extract_domains(LISTS[name](path, args.top)))
+        if args.sort:
+            domains = sorted(domains)
+
+        if args.output:
+            with open(args.output.replace('{list}', name), 'w') as out:
+                for domain in domains:
+                    out.write(domain + '\n')
+        else:
+            prefix = name + ',' if len(lists) > 1 else ''
+            for domain in domains:
+                sys.stdout.write(prefix + domain + '\n')
+
+    info = registered_domain.cache_info()
+    sys.stderr.write("suffix lookups: %d, memoized: %d\n" % (info.hits + info.misses, info.hits))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+# read the CrUX and Tranco top lists and compare them.
+#
+# a list is loaded as a RankedDomains: the registered domains (domain +
+# public suffix) in rank order, each once, as 64-bit hashes plus their
+# ranks in numpy arrays. the overlap of the two lists at many top N at
+# once is then a few sorts and searchsorted calls instead of sort, diff -y
+# and uniq -c on temp files:
+#
+#   ./toplists.py --crux ../data/crux/202212.csv --tranco ../data/tranco/top-1m.csv --n 1000,10000,100000,1000000
+#
+#      n   crux  tranco  common  jaccard
+#   1000   ...
+#
+# CrUX ranks are buckets (1000, 5000, 10000, ...) and the list is sorted by
+# them, the top 1000 is the 1000 bucket. Tranco ranks are exact.
+
+import argparse
+import functools
+import gzip
+import hashlib
+import sys
+
+import numpy as np
+import tldextract
+
+DOMAIN_CACHE_SIZE = 2 ** 16   # hostnames whose public suffix lookup is memoized
+RANK_BUCKETS = [1000, 5000, 10000, 50000, 100000, 500000, 1000000]   # the CrUX buckets
+TOP_N = [1000, 5000, 10000, 50000, 100000, 500000, 1000000]   # default n of the comparison
+
+extract = tldextract.TLDExtract()
+
+@functools.lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def registered_domain(hostname):
+    # the same host is often in both lists and in CrUX as http:// and
+    # https:// origins
+    ext = extract(hostname)
+    return '.'.join(part for part in [ext.domain, ext.suffix] if part)
+
+def open_list(path):
+    return gzip.open(path, 'rt') if path.endswith('.gz') else open(path)
+
+def crux_hosts(path, top):
+    # yields (rank, hostname) of origin,rank lines with a header:
+    #   https://czbooks.net,1000
+    with open_list(path) as f:
+        next(f, None)
+        for line in f:
+            origin, _, rank = line.strip().rpartition(',')
+            if not origin:
+                continue
+            if int(rank) > top:
+                break
+            # origins have no path, this is several times faster than urlsplit
+            yield int(rank), origin.partition('://')[2].partition(':')[0]
+
+def tranco_hosts(path, top):
+    # yields (rank, hostname) of rank,domain lines without a header:
+    #   1,google.com
+    with open_list(path) as f:
+        for line in f:
+            rank, _, domain = line.strip().partition(',')
+            if not domain:
+                continue
+            if int(rank) > top:
+                break
+            yield int(rank), domain
+
+LISTS = {'crux': crux_hosts, 'tranco': tranco_hosts}
+
+def extract_domains(hosts):
+    # (rank, registered domain) in rank order, every domain once at its
+    # best rank
+    seen = set()
+    for rank, hostname in hosts:
+        if not hostname:
+            continue
+        domain = registered_domain(hostname.lower())
+        if domain and domain not in seen:
+            seen.add(domain)
+            yield rank, domain
+
+def domain_hash(domain):
+    return int.from_bytes(hashlib.blake2b(domain.encode(), digest_size=8).digest(), 'little')
+
+class RankedDomains(object):
+    # the domains of one list. hashes and ranks are aligned numpy arrays in
+    # rank order, the domain strings are only kept for printing differences
+
+    def __init__(self, name, ranked):
+        self.name = name
+        ranked = list(ranked)
+        self.domains = [domain for _, domain in ranked]
+        self.ranks = np.array([rank for rank, _ in ranked], dtype=np.uint32)
+        self.hashes = np.array([domain_hash(domain) for domain in self.domains], dtype=np.uint64)
+
+    @classmethod
+    def load(cls, name, path, top=max(TOP_N)):
+        return cls(name, extract_domains(LISTS[name](path, top)))
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def count(self, n):
+        # number of domains in the top n, for an array of n
+        return np.searchsorted(self.ranks, n, side='right')
+
+def common_ranks(a, b):
+    # the (rank in a, rank in b) of every domain in both lists
+    _, index_a, index_b = np.intersect1d(a.hashes, b.hashes, assume_unique=True, return_indices=True)
+    return a.ranks[index_a], b.ranks[index_b]
+
+def overlap(a, b, n=TOP_N):
+    # for every n: domains in the top n of a, of b, of both, and the jaccard
+    # index. a common domain is in both top n once the worse of its two
+    # ranks is, so all n are answered from one sorted array
+    n = np.asarray(n)
+    ranks_a, ranks_b = common_ranks(a, b)
+    both = np.sort(np.maximum(ranks_a, ranks_b))
+    common = np.searchsorted(both, n, side='right')
+    count_a = a.count(n)
+    count_b = b.count(n)
+    union = count_a + count_b - common
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jaccard = np.where(union > 0, common / union, np.nan)
+    return {'n': n, a.name: count_a, b.name: count_b, 'common': common, 'jaccard': jaccard}
+
+def bucket_matrix(a, b, buckets=RANK_BUCKETS):
+    # number of common domains by (rank bucket in a, rank bucket in b).
+    # ranks past the last bucket are in the last row / column
+    ranks_a, ranks_b = common_ranks(a, b)
+    rows = np.minimum(np.searchsorted(buckets, ranks_a), len(buckets) - 1)
+    cols = np.minimum(np.searchsorted(buckets, ranks_b), len(buckets) - 1)
+    matrix = np.zeros((len(buckets), len(buckets)), dtype=np.int64)
+    np.add.at(matrix, (rows, cols), 1)
+    return matrix
+
+def difference(a, b, n):
+    # the domains in the top n of a that aren't in the top n of b, in a's
+    # rank order, e.g. crawl targets one list has and the other misses
+    count_a = int(a.count(n))
+    top_b = b.hashes[:int(b.count(n))]
+    missing = ~np.isin(a.hashes[:count_a], top_b)
+    return [a.domains[i] for i in np.flatnonzero(missing)]
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--crux", type=str, required=True, help="CrUX list (origin,rank), e.g. ../data/crux/202212.csv")
+    parser.add_argument("--tranco", type=str, required=True, help="Tranco list (rank,domain), e.g. ../data/tranco/top-1m.csv")
+    parser.add_argument("--n", type=str, default=','.join(str(n) for n in TOP_N), help="Comma separated top n to compare at")
+    parser.add_argument("--buckets", help="Also print the common domains by CrUX x Tranco rank bucket", action="store_true")
+    parser.add_argument("--only", choices=LISTS, help="Print the domains in the top n (the first --n) of only this list instead")
+    args = parser.parse_args()
+
+    n = [int(value) for value in args.n.split(',')]
+    crux = RankedDomains.load('crux', args.crux, max(n))
+    tranco = RankedDomains.load('tranco', args.tranco, max(n))
+
+    if args.only:
+        a, b = (crux, tranco) if args.only == 'crux' else (tranco, crux)
+        for domain in difference(a, b, n[0]):
+            print(domain)
+        sys.exit(0)
+
+    result = overlap(crux, tranco, n)
+    print("%10s %10s %10s %10s %8s" % ('n', 'crux', 'tranco', 'common', 'jaccard'))
+    for i in range(len(n)):
+        print("%10d %10d %10d %10d %8.3f" % (result['n'][i], result['crux'][i], result['tranco'][i], result['common'][i], result['jaccard'][i]))
+
+    if args.buckets:
+        matrix = bucket_matrix(crux, tranco)
+        print()
+        print("%11s " % 'crux\\tranco' + ' '.join("%8d" % bucket for bucket in RANK_BUCKETS))
+        for bucket, row in zip(RANK_BUCKETS, matrix):
+            print("%11d " % bucket + ' '.join("%8d" % count for count in row))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import unittest
+import os
+import json
+import tempfile
+import numpy as np
+from validation import load_labels, load_dom_inference, align, confusion, columns, site_rates, PROVIDERS
+
+HEADER = "outputPrefix,timestamp,url,login_url,screenshot_url,screenshot_login_url,html_url,html_login_url,1st,amazon,apple,github,google,facebook,linkedin,microsoft,twitter,yahoo\n"
+
+class ValidationTest(unittest.TestCase):
+
+    def write(self, tmp_dir: str, name: str, content: str) -> str:
+        path = os.path.join(tmp_dir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_load_dom_inference(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_file = self.write(tmp_dir, "websites.csv", HEADER +
+                "1000,2023-02-01T08:16:06.452Z,https://ok.ru,https://ok.ru/dk,1000-https!ok.ru-20230201081606453-0.png,1000-https!ok.ru-20230201081606453-1.png,1000-https!ok.ru-20230201081606453-0.html.gz,1000-https!ok.ru-20230201081606453-1.html.gz,1,0,0,0,1,1,0,0,0,0\n"
+                # the comma in login_url isn't quoted by the crawler
+                "1000,2023-02-01T08:16:07.452Z,https://vk.com,https://vk.com/login?a=1,b=2,1000-https!vk.com-20230201081607453-0.png,1000-https!vk.com-20230201081607453-1.png,1000-https!vk.com-20230201081607453-0.html.gz,1000-https!vk.com-20230201081607453-1.html.gz,0,0,1,0,0,0,0,0,0,1\n")
+
+            dom = load_dom_inference(csv_file)
+            self.assertEqual(["ok.ru", "vk.com"], list(dom.sites))
+            self.assertEqual([1, 0, 0, 0, 1, 1, 0, 0, 0, 0], dom.matrix[dom.index["ok.ru"]].tolist())
+            self.assertEqual([0, 0, 1, 0, 0, 0, 0, 0, 0, 1], dom.matrix[dom.index["vk.com"]].tolist())
+
+    def test_confusion(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            labels_file = self.write(tmp_dir, "labeled_user.json", json.dumps({
+                "1000-https!ok.ru-20230201081606453-combined.png": ["1st", "Google", "Facebook"],
+                "1000-https!vk.com-20230201081607453-combined.png": ["Meta-nosso"],
+                "1000-https!x.com-20230201081608453-combined.png": ["Meta-broken"],
+                "1000-https!y.com-20230201081609453-combined.png": ["Apple"],
+            }))
+            csv_file = self.write(tmp_dir, "websites.csv",
+                "1000,2023-02-01T08:16:06.452Z,https://ok.ru,https://ok.ru/dk,a-0.png,a-1.png,a-0.html.gz,a-1.html.gz,1,0,0,0,1,0,0,0,0,0\n"
+                "1000,2023-02-01T08:16:07.452Z,https://vk.com,https://vk.com/,b-0.png,b-1.png,b-0.html.gz,b-1.html.gz,0,0,0,0,1,0,0,0,0,0\n")
+
+            labels, skipped, nosso = load_labels(labels_file)
+            self.assertEqual((3, 1, 1), (len(labels), skipped, nosso))
+
+            actual, predicted, missing = align(labels, load_dom_inference(csv_file))
+            self.assertEqual([False, False, True], missing.tolist())
+
+            counts = confusion(actual, predicted, columns(["google", "facebook"]))
+            self.assertEqual(1, counts["TP"].sum())
+            self.assertEqual(1, counts["FP"].sum())
+            self.assertEqual(1, counts["FN"].sum())
+            self.assertEqual(1, counts["TN"].sum())
+            self.assertTrue(np.allclose([0.5, 0.5], site_rates(counts)["correct"]))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
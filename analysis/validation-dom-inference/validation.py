@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+# vectorized validation of SSO detection against the hand labels.
+#
+# labels and predictions are loaded into (sites x providers) 0/1 matrices
+# with the columns in PROVIDERS order, aligned by site, and the confusion
+# matrices and rates of all sites and providers are computed at once with
+# numpy instead of one python loop per site:
+#
+#   labels, skipped, nosso = load_labels('labeled_user.json')
+#   dom = load_dom_inference('websites-2023-02-01.csv')
+#   actual, predicted, missing = align(labels, dom)
+#   counts = confusion(actual, predicted, columns(['first']))
+#   print_summary(site_rates(counts))
+
+import json
+from urllib.parse import urlparse
+
+import numpy as np
+
+# the column order of the websites-*.csv detection columns
+PROVIDERS = ['first', 'amazon', 'apple', 'github', 'google', 'facebook', 'linkedin', 'microsoft', 'twitter', 'yahoo']
+
+# what templatematch has templates for
+TEMPLATEMATCH_PROVIDERS = ['amazon', 'apple', 'github', 'google', 'facebook', 'linkedin', 'microsoft', 'twitter', 'yahoo']
+
+# sites with any of these labels aren't counted at all. "Meta-nosso" sites
+# are counted with every provider 0
+LABELS_SKIPPED = ['meta-nonenglish', 'meta-broken', 'meta-recrawl']
+LABEL_NOSSO = 'meta-nosso'
+
+class Detections(object):
+    # one 0/1 row per site, one column per provider in PROVIDERS order
+
+    def __init__(self, sites, matrix):
+        self.sites = np.asarray(sites, dtype=object)
+        self.matrix = np.asarray(matrix, dtype=np.int8).reshape(len(self.sites), len(PROVIDERS))
+        self.index = {site: i for i, site in enumerate(self.sites)}
+
+    def __len__(self):
+        return len(self.sites)
+
+def columns(providers):
+    return np.array([PROVIDERS.index(provider) for provider in providers])
+
+def site_from_filename(filename):
+    # 1000-https!cardgames.io-20230201094318999-combined.png -> cardgames.io
+    # 1000-https!www.priceline.com-20230201102900088-1.png -> www.priceline.com
+    return filename.split('!', 1)[1].rsplit('-', 2)[0]
+
+def load_labels(path):
+    # labeled_user.json of simplabel, returns (Detections, skipped sites, no sso sites)
+    with open(path) as f:
+        json_labeled = json.load(f)
+
+    sites = []
+    rows = []
+    skipped = 0
+    nosso = 0
+    for filename, values in json_labeled.items():
+        values = set(value.lower() for value in values)
+        if values.intersection(LABELS_SKIPPED):
+            skipped += 1
+            continue
+
+        sites.append(site_from_filename(filename))
+        if LABEL_NOSSO in values:
+            nosso += 1
+            rows.append([0] * len(PROVIDERS))
+        else:
+            # "1st" is the label of the first party login, "Other" isn't counted
+            rows.append([1 if ('1st' if provider == 'first' else provider) in values else 0 for provider in PROVIDERS])
+
+    return Detections(sites, rows), skipped, nosso
+
+def load_dom_inference(path):
+    # websites-*.csv of the crawler, the detections are the last 10 columns.
+    # they are counted from the end, an unquoted comma in login_url (after
+    # the url of the site) splits it into more columns
+    sites = []
+    rows = []
+    with open(path) as f:
+        for line in f:
+            fields = line.strip().split(',')
+            if len(fields) < 8 + len(PROVIDERS) or not fields[-1].isdigit():
+                continue   # short or header row
+            sites.append(urlparse(fields[2]).hostname)
+            rows.append(fields[-len(PROVIDERS):])
+
+    return Detections(sites, np.array(rows, dtype=np.int8) if rows else np.zeros((0, len(PROVIDERS))))
+
+def load_templatematch(path):
+    # csv output of templatematch.py (name,provider,template,confidence,...).
+    # screenshots without any match aren't in the output at all, so they are
+    # missing rather than all 0. returns (Detections, unknown providers)
+    sites = {}
+    unknown = 0
+    with open(path) as f:
+        for line in f:
+            fields = line.strip().split(',')
+            if len(fields) < 4:
+                continue
+            row = sites.setdefault(site_from_filename(fields[0]), [0] * len(PROVIDERS))
+            provider = fields[1].strip().lower()
+            if provider in TEMPLATEMATCH_PROVIDERS:
+                row[PROVIDERS.index(provider)] = 1
+            else:
+                unknown += 1
+
+    return Detections(list(sites.keys()), list(sites.values())), unknown
+
+def align(labels, predictions):
+    # returns the (actual, predicted) matrices of the labeled sites that have
+    # predictions, in label order, and the boolean mask of labeled sites
+    # without predictions
+    positions = np.array([predictions.index.get(site, -1) for site in labels.sites], dtype=np.int64)
+    missing = positions < 0
+    return labels.matrix[~missing], predictions.matrix[positions[~missing]], missing
+
+def confusion(actual, predicted, cols=None):
+    # (sites x providers) boolean TP / FP / TN / FN matrices of the given columns
+    if cols is not None:
+        actual = actual[:, cols]
+        predicted = predicted[:, cols]
+    actual = actual.astype(bool)
+    predicted = predicted.astype(bool)
+    return {
+        'TP': actual & predicted,
+        'FP': ~actual & predicted,
+        'TN': ~actual & ~predicted,
+        'FN': actual & ~predicted,
+    }
+
+def rates(counts, axis):
+    # axis=1 sums over the providers (per site rates), axis=0 over the sites
+    # (per provider rates). rates with a 0 denominator are nan
+    tp, fp, tn, fn = (counts[name].sum(axis=axis) for name in ['TP', 'FP', 'TN', 'FN'])
+    p = tp + fn
+    n = fp + tn
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'TP': tp, 'FP': fp, 'TN': tn, 'FN': fn,
+            'correct': (tp + tn) / (p + n),
+            'TPR': tp / p,   # recall/sensitivity
+            'FNR': fn / p,   # miss rate
+            'FPR': fp / n,   # false positive rate
+            'TNR': tn / n,   # specificity
+        }
+
+def site_rates(counts):
+    return rates(counts, axis=1)
+
+def provider_rates(counts):
+    return rates(counts, axis=0)
+
+def describe(values, n=10):
+    # median, mean, count and the n-quantile cut points of the non-nan
+    # values. the quantiles are the same as statistics.quantiles(values, n)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {'median': None, 'mean': None, 'length': 0, 'quantiles': []}
+    return {
+        'median': float(np.median(values)),
+        'mean': float(values.mean()),
+        'length': len(values),
+        'quantiles': [float(q) for q in np.quantile(values, np.arange(1, n) / n, method='weibull')] if len(values) > 1 else [],
+    }
+
+def print_summary(per_site):
+    stats = describe(per_site['correct'])
+    print(f"correctness median: {stats['median']} mean: {stats['mean']} length: {stats['length']}")
+    print(f"correctness quantiles: {stats['quantiles']}")
+    for rate in ['TPR', 'FNR', 'FPR', 'TNR']:
+        stats = describe(per_site[rate])
+        print(f"{rate} median: {stats['median']} mean: {stats['mean']} length: {stats['length']}")
+
+def print_providers(per_provider, providers):
+    print("provider   TP    FP    TN    FN    TPR    FPR")
+    for i, provider in enumerate(providers):
+        print(f"{provider:<10} {per_provider['TP'][i]:<5} {per_provider['FP'][i]:<5} {per_provider['TN'][i]:<5} {per_provider['FN'][i]:<5} "
+              f"{per_provider['TPR'][i]:<6.3f} {per_provider['FPR'][i]:<6.3f}")
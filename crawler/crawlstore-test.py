@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import unittest
+import os
+import tempfile
+import pyarrow as pa
+from crawlstore import convert, load, PROVIDERS
+
+WEBSITES_ROWS = (
+    "1000,2024-05-30T06:00:42.284Z,https://www.spectrum.net,https://www.spectrum.net/,1000-https!www.spectrum.net-20240530060042285-0.png,1000-https!www.spectrum.net-20240530060042285-1.png,1000-https!www.spectrum.net-20240530060042285-0.html.gz,1000-https!www.spectrum.net-20240530060042285-1.html.gz,0,0,0,0,1,0,0,0,0,0\n"
+    # the comma in login_url isn't quoted by the crawler
+    "5000,2024-05-30T06:00:44.237Z,https://vk.com,https://vk.com/login?a=1,b=2,5000-https!vk.com-20240530060044238-0.png,5000-https!vk.com-20240530060044238-1.png,5000-https!vk.com-20240530060044238-0.html.gz,5000-https!vk.com-20240530060044238-1.html.gz,1,0,1,0,1,0,0,0,0,1\n"
+)
+
+class CrawlStoreTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for format in ["parquet", "arrow"]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                csv_file = os.path.join(tmp_dir, "websites-DEV.csv")
+                with open(csv_file, "w") as f:
+                    f.write(WEBSITES_ROWS)
+                store = os.path.join(tmp_dir, "crawlstore")
+
+                converted = convert([csv_file], store, country="us", format=format)
+                self.assertEqual([(csv_file, ("2024-05-30", "us"), 2)], converted)
+                self.assertTrue(os.path.isdir(os.path.join(store, "crawl_date=2024-05-30", "country=us")), format)
+
+                # only the requested column, with its type
+                google = load(store, columns=["google"])
+                self.assertEqual(["google"], google.column_names)
+                self.assertEqual(pa.uint8(), google.schema.field("google").type)
+                self.assertEqual([1, 1], google["google"].to_pylist())
+
+                table = load(store, crawl_date="2024-05-30", country="us")
+                rows = table.to_pylist()
+                self.assertEqual("https://vk.com/login?a=1,b=2", rows[1]["login_url"])
+                self.assertEqual("5000-https!vk.com-20240530060044238-1.png", rows[1]["screenshot_login_url"])
+                self.assertEqual([1, 0, 1, 0, 1, 0, 0, 0, 0, 1], [rows[1][provider] for provider in PROVIDERS])
+                self.assertEqual(("2024-05-30", "us"), (rows[0]["crawl_date"], rows[0]["country"]))
+
+                self.assertEqual(0, load(store, country="de").num_rows)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+# columnar store of crawl results, so analyses don't have to re-parse the
+# csvs with split(',') or a full pd.read_csv every time.
+#
+# reads any of the crawl csv formats
+#
+#   websites-*.csv  (no header)   outputPrefix,timestamp,url,login_url,screenshot_url,screenshot_login_url,html_url,html_login_url,1st,amazon,...,yahoo
+#   us_res.csv      (header)      rank,website,1st,Amazon,...,Yahoo
+#   de1.csv         (header)      origin,rank   (top lists: not crawled yet, the providers are null)
+#
+# into one typed dataset, partitioned by crawl date and country:
+#
+#   crawlstore/crawl_date=2024-05-30/country=us/websites-DEV-0.parquet
+#
+# urls are dictionary encoded and the providers are uint8 columns, so an
+# analysis only reads the columns it needs. with --format arrow the files
+# are uncompressed arrow ipc and load() memory maps them (zero-copy)
+# instead of decoding parquet pages.
+#
+#   ./crawlstore.py convert websites-DEV.csv us_res.csv --output crawlstore
+#   ./crawlstore.py summary crawlstore
+#
+#   from crawlstore import load
+#   google = load('crawlstore', columns=['google'])['google']
+
+import argparse
+import csv
+import datetime
+import glob
+import os
+import re
+import sys
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs
+
+PROVIDERS = ['1st', 'amazon', 'apple', 'github', 'google', 'facebook', 'linkedin', 'microsoft', 'twitter', 'yahoo']
+WEBSITES_COLUMNS = ['rank', 'timestamp', 'url', 'login_url', 'screenshot_url', 'screenshot_login_url', 'html_url', 'html_login_url']
+
+CATEGORICAL = pa.dictionary(pa.int32(), pa.string())
+SCHEMA = pa.schema(
+    [('rank', pa.uint32()),   # outputPrefix, the top list bin of the site
+     ('timestamp', pa.timestamp('ms', tz='UTC')),
+     ('url', CATEGORICAL),
+     ('login_url', CATEGORICAL),
+     ('screenshot_url', pa.string()),
+     ('screenshot_login_url', pa.string()),
+     ('html_url', pa.string()),
+     ('html_login_url', pa.string())] +
+    [(provider, pa.uint8()) for provider in PROVIDERS])
+
+PARTITIONING = ds.partitioning(pa.schema([('crawl_date', pa.string()), ('country', pa.string())]), flavor='hive')
+UNKNOWN = 'unknown'   # partition value when the date or country can't be inferred
+
+FORMATS = {'parquet': ('parquet', 'parquet'), 'arrow': ('ipc', 'arrow')}   # --format -> (pyarrow format, extension)
+
+def parse_timestamp(value):
+    # 2024-05-30T06:00:42.284Z
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+
+def parse_flag(value):
+    return int(value) if value not in ('', None) else None
+
+def read_rows(path):
+    # yields dicts with the SCHEMA columns, whatever the format of the csv
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = None
+        for fields in reader:
+            if not fields:
+                continue
+
+            if header is None and not fields[0].strip().isdigit():
+                header = [name.strip().lower() for name in fields]
+                continue
+
+            if header is None:
+                # websites-*.csv. the provider flags are the last columns, so
+                # an unquoted comma in the login url doesn't shift them
+                if len(fields) < len(WEBSITES_COLUMNS) + len(PROVIDERS):
+                    continue
+                flags = fields[-len(PROVIDERS):]
+                row = {'rank': int(fields[0]), 'timestamp': parse_timestamp(fields[1]), 'url': fields[2],
+                       'login_url': ','.join(fields[3:len(fields) - len(PROVIDERS) - 4]) or None}
+                row.update(zip(WEBSITES_COLUMNS[4:], fields[-len(PROVIDERS) - 4:-len(PROVIDERS)]))
+                row.update(zip(PROVIDERS, (parse_flag(flag) for flag in flags)))
+            else:
+                record = dict(zip(header, fields))
+                url = record.get('website') or record.get('origin') or record.get('url')
+                if not url:
+                    continue   # e.g. the totals row at the end of us_res.csv
+                rank = record.get('rank') or record.get('outputprefix')
+                row = {'rank': int(rank) if rank else None, 'timestamp': parse_timestamp(record.get('timestamp')), 'url': url,
+                       'login_url': record.get('login_url') or None}
+                row.update((column, record.get(column) or None) for column in WEBSITES_COLUMNS[4:])
+                row.update((provider, parse_flag(record.get(provider))) for provider in PROVIDERS)
+            yield row
+
+def read_table(path):
+    rows = list(read_rows(path))
+    columns = {}
+    for field in SCHEMA:
+        values = [row.get(field.name) for row in rows]
+        if field.type == CATEGORICAL:
+            columns[field.name] = pa.array(values, pa.string()).dictionary_encode()
+        else:
+            columns[field.name] = pa.array(values, field.type)
+    return pa.table(columns, schema=SCHEMA)
+
+def infer_date(path, table):
+    # websites-2023-02-01.csv, us_202302.csv, or the first crawl timestamp
+    name = os.path.basename(path)
+    match = re.search(r'(20\d\d)-?(\d\d)(?:-?(\d\d))?', name)
+    if match:
+        return '-'.join(part for part in match.groups() if part)
+    timestamps = pc.drop_null(table['timestamp'])
+    if len(timestamps):
+        return timestamps[0].as_py().date().isoformat()
+    return UNKNOWN
+
+def infer_country(path):
+    # de1.csv, us_res.csv, us202404_new.csv
+    match = re.match(r'^([a-z]{2})(?=[_\d.])', os.path.basename(path))
+    return match.group(1) if match else UNKNOWN
+
+def convert(paths, output, crawl_date=None, country=None, format='parquet'):
+    # one file per csv (and partition), converting a csv again replaces its files
+    ds_format, extension = FORMATS[format]
+    file_options = ds.ParquetFileFormat().make_write_options(compression='zstd') if format == 'parquet' else ds.IpcFileFormat().make_write_options(compression=None)
+
+    converted = []
+    for path in paths:
+        table = read_table(path)
+        partition = (crawl_date or infer_date(path, table), country or infer_country(path))
+        table = table.append_column('crawl_date', pa.array([partition[0]] * len(table), pa.string()))
+        table = table.append_column('country', pa.array([partition[1]] * len(table), pa.string()))
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        ds.write_dataset(table, output, format=ds_format, partitioning=PARTITIONING, file_options=file_options,
+                         basename_template=stem + '-{i}.' + extension, existing_data_behavior='overwrite_or_ignore')
+        converted.append((path, partition, len(table)))
+    return converted
+
+def dataset(store):
+    # arrow ipc files are memory mapped, parquet files are decoded
+    if glob.glob(os.path.join(store, '**', '*.arrow'), recursive=True):
+        return ds.dataset(store, format='ipc', partitioning=PARTITIONING, filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
+    return ds.dataset(store, format='parquet', partitioning=PARTITIONING)
+
+def load(store, columns=None, crawl_date=None, country=None):
+    # only reads the given columns of the given partitions
+    condition = None
+    for name, value in [('crawl_date', crawl_date), ('country', country)]:
+        if value is not None:
+            expression = ds.field(name) == value
+            condition = expression if condition is None else condition & expression
+    return dataset(store).to_table(columns=columns, filter=condition)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help="Add crawl csvs to the store")
+    convert_parser.add_argument("csv_files", type=str, nargs='+', help="websites-*.csv, us_res.csv style results or origin,rank top lists")
+    convert_parser.add_argument("--output", type=str, default='crawlstore', help="Store directory (default: crawlstore)")
+    convert_parser.add_argument("--date", type=str, help="Crawl date partition. Inferred from the file name or the first timestamp by default.")
+    convert_parser.add_argument("--country", type=str, help="Country partition. Inferred from the file name (de1.csv, us_res.csv) by default.")
+    convert_parser.add_argument("--format", choices=FORMATS, default='parquet', help="parquet (compressed) or arrow (uncompressed, memory mapped when loaded)")
+
+    summary_parser = subparsers.add_parser('summary', help="Count the sites and detections of every partition")
+    summary_parser.add_argument("store", type=str, help="Store directory")
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        for path, (crawl_date, country), rows in convert(args.csv_files, args.output, args.date, args.country, args.format):
+            sys.stderr.write("%s: %d rows -> crawl_date=%s/country=%s\n" % (path, rows, crawl_date, country))
+
+    elif args.command == 'summary':
+        table = load(args.store, columns=['crawl_date', 'country'] + PROVIDERS)
+        grouped = table.group_by(['crawl_date', 'country']).aggregate([('country', 'count')] + [(provider, 'sum') for provider in PROVIDERS])
+        print(','.join(['crawl_date', 'country', 'sites'] + PROVIDERS))
+        for row in grouped.sort_by([('crawl_date', 'ascending'), ('country', 'ascending')]).to_pylist():
+            print(','.join(str(value if value is not None else '') for value in [row['crawl_date'], row['country'], row['country_count']] + [row[provider + '_sum'] for provider in PROVIDERS]))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# run the SSO inference of clicker.js again over the html the crawl saved,
+# so a change to the detection rules doesn't need a new crawl:
+#
+#   ./reanalyze.py websites-DEV.csv output-DEV > websites-DEV-reanalyzed.csv
+#   ./reanalyze.py websites-DEV.csv output-DEV --labels "Sign in with,Continue with,Sign in using" --changed
+#
+# the rules are the ones of clicker.js on the page after the login click
+# (-1.html.gz):
+#
+#   1st        there's an <input type="password">
+#   providers  the text matches /(Sign in with|Continue with|...)\s+(Amazon|Apple|...)/i,
+#              every provider named in a match is a 1
+#
+# and the output has the websites-*.csv layout, only the 10 flags are
+# replaced. the html is parsed with a few regular expressions instead of an
+# html parser or a browser: script, style, noscript, template and comment
+# contents are dropped, the text is the rest without the tags (like
+# textContent, "Sign in with <b>Google</b>" is "Sign in with Google").
+# unlike the live run this can't tell whether an element is visible and
+# only sees the main frame, page.content() doesn't save iframes.
+#
+# sites are read and matched in a pool of worker processes, rows come out
+# in the order of the input csv.
+
+import argparse
+import gzip
+import html
+import multiprocessing
+import os
+import re
+import sys
+import zlib
+
+# the order of the websites-*.csv flag columns, new providers go at the end
+PROVIDERS = ['Amazon', 'Apple', 'GitHub', 'Google', 'Facebook', 'LinkedIn', 'Microsoft', 'Twitter', 'Yahoo']
+COLUMNS = ['1st'] + [provider.lower() for provider in PROVIDERS]
+LABELS = ['Sign up with', 'Sign in with', 'Continue with', 'Log in with', 'Login with', 'Register with']
+
+HTML_COLUMNS = {0: -len(COLUMNS) - 2, 1: -len(COLUMNS) - 1}   # --page -> column of its html.gz in websites-*.csv
+
+HIDDEN_RE = re.compile(r'<!--.*?-->|<(script|style|noscript|template)\b[^>]*>.*?</\1\s*>', re.S | re.I)
+TAG_RE = re.compile(r'<[^>]*>')
+SPACE_RE = re.compile(r'\s+')
+PASSWORD_RE = re.compile(r'<input\b[^>]*?\btype\s*=\s*["\']?password\b', re.I)
+
+def oauth_regex(labels=LABELS, providers=PROVIDERS):
+    return re.compile(r'(%s)\s+(%s)' % ('|'.join(map(re.escape, labels)), '|'.join(map(re.escape, providers))), re.I)
+
+def visible_text(document):
+    # whitespace is normalized like playwright does for text=, &nbsp; too
+    return SPACE_RE.sub(' ', html.unescape(TAG_RE.sub('', document)))
+
+def detect(document, regex):
+    # returns the 0/1 flags in COLUMNS order
+    document = HIDDEN_RE.sub(' ', document)
+    found = {provider.lower() for _, provider in regex.findall(visible_text(document))}
+    first = 1 if PASSWORD_RE.search(document) else 0
+    return [first] + [1 if column in found else 0 for column in COLUMNS[1:]]
+
+def read_html(path):
+    with gzip.open(path, 'rb') as f:
+        return f.read().decode('utf-8', errors='replace')
+
+def reanalyze_site(task):
+    # returns (fields, flags, error), flags is None if the html can't be read
+    fields, path, regex = task
+    try:
+        return (fields, detect(read_html(path), regex), None)
+    except (OSError, EOFError, zlib.error) as e:
+        return (fields, None, str(e))
+
+def read_websites(path):
+    # yields the fields of every websites-*.csv line. a login url with a
+    # comma is split too, the file names and flags are always at the end
+    with open(path) as f:
+        for line in f:
+            fields = line.rstrip('\n').split(',')
+            if len(fields) >= 8 + len(COLUMNS):
+                yield fields
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("websites", type=str, help="websites-*.csv of the crawl")
+    parser.add_argument("datadir", type=str, help="Crawler output directory with the -0.html.gz / -1.html.gz files")
+    parser.add_argument("--page", type=int, choices=HTML_COLUMNS, default=1, help="Analyze the landing page (0) or the page after the login click (1, default, like clicker.js)")
+    parser.add_argument("--labels", type=str, default=','.join(LABELS), help="Comma separated button labels before the provider name (default: the clicker.js labels)")
+    parser.add_argument("--changed", help="Only write the sites whose flags differ from the live crawl", action="store_true")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    args = parser.parse_args()
+
+    regex = oauth_regex([label.strip() for label in args.labels.split(',') if label.strip()])
+    tasks = ((fields, os.path.join(args.datadir, fields[HTML_COLUMNS[args.page]]), regex) for fields in read_websites(args.websites))
+
+    counts = {'sites': 0, 'changed': 0, 'missing': 0}
+    live = [0] * len(COLUMNS)
+    reanalyzed = [0] * len(COLUMNS)
+    with multiprocessing.Pool(args.workers) as pool:
+        for fields, flags, error in pool.imap(reanalyze_site, tasks, chunksize=16):
+            if flags is None:
+                counts['missing'] += 1
+                sys.stderr.write("%s: %s\n" % (fields[2], error))
+                continue
+
+            old = [int(flag) for flag in fields[-len(COLUMNS):]]
+            counts['sites'] += 1
+            live = [a + b for a, b in zip(live, old)]
+            reanalyzed = [a + b for a, b in zip(reanalyzed, flags)]
+            if flags != old:
+                counts['changed'] += 1
+            elif args.changed:
+                continue
+            sys.stdout.write(','.join(fields[:-len(COLUMNS)] + [str(flag) for flag in flags]) + '\n')
+
+    sys.stderr.write("%(sites)d sites, %(changed)d changed, %(missing)d without html\n" % counts)
+    sys.stderr.write("%-10s %6s %6s\n" % ('', 'live', 'now'))
+    for column, a, b in zip(COLUMNS, live, reanalyzed):
+        sys.stderr.write("%-10s %6d %6d\n" % (column, a, b))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+FFT_CACHE_MB = 128        # memory budget for cached template spectra, per process
+FFT_NORM_CACHE_MB = 64    # memory budget for the window norms of one screenshot, per process
+FFT_MEMORY_FRACTION = 0.25   # the caches of all worker processes together stay within this fraction of the available memory
+FLAT_WINDOW_NORM = 1e-3   # windows with a smaller norm have no texture to correlate with
+
+def available_memory_mb():
+    # MemAvailable of /proc/meminfo, None where there is none
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def fft_cache_budget(workers=1, available_mb=None) -> tuple[int, int]:
+    # (cache_mb, norm_cache_mb) for each of `workers` processes. every
+    # process has its own caches, so with many workers they are shrunk to
+    # stay within FFT_MEMORY_FRACTION of the available memory together
+    available_mb = available_mb or available_memory_mb()
+    if not available_mb:
+        return (FFT_CACHE_MB, FFT_NORM_CACHE_MB)
+    scale = min(1.0, available_mb * FFT_MEMORY_FRACTION / max(1, workers) / (FFT_CACHE_MB + FFT_NORM_CACHE_MB))
+    return (int(FFT_CACHE_MB * scale), max(1, int(FFT_NORM_CACHE_MB * scale)))
+
+class ScreenshotSpectrum(object):
+    # Everything about one screenshot (or region) that every template needs:
+    # its DFT and the per template size window norms.
+
+    def __init__(self, website_img: cv2.Mat, norm_cache_mb=FFT_NORM_CACHE_MB):
+        self.rows, self.cols = website_img.shape[:2]
+        self.dft_rows = cv2.getOptimalDFTSize(self.rows)
+        self.dft_cols = cv2.getOptimalDFTSize(self.cols)
+
+        padded = np.zeros((self.dft_rows, self.dft_cols), np.float32)
+        padded[:self.rows, :self.cols] = website_img
+        self.spectrum = cv2.dft(padded)
+
+        self.image = website_img
+
+        # the bank has over 100 template sizes and a norm map is as big as
+        # the screenshot, so only the recently used ones are kept
+        self.norm_cache_bytes = norm_cache_mb * 1024 * 1024
+        self.inv_window_norms = OrderedDict()
+        self.lock = threading.Lock()
+
+    def inv_window_norm(self, trows: int, tcols: int) -> np.ndarray:
+        # 1 / sqrt(sum(I^2) - sum(I)^2 / n) of every window, shared by all
+        # templates of the same size. flat windows get 0, cv2.matchTemplate
+        # scores those 0 as well.
+        key = (trows, tcols)
+        with self.lock:
+            if key in self.inv_window_norms:
+                self.inv_window_norms.move_to_end(key)
+                return self.inv_window_norms[key]
+
+        rows, cols = self.rows - trows + 1, self.cols - tcols + 1
+        window_sum = cv2.boxFilter(self.image, cv2.CV_64F, (tcols, trows), anchor=(0, 0), normalize=False, borderType=cv2.BORDER_CONSTANT)[:rows, :cols]
+        window_sqsum = cv2.sqrBoxFilter(self.image, cv2.CV_64F, (tcols, trows), anchor=(0, 0), normalize=False, borderType=cv2.BORDER_CONSTANT)[:rows, :cols]
+        variance = cv2.scaleAdd(cv2.multiply(window_sum, window_sum), -1.0 / (trows * tcols), window_sqsum).astype(np.float32)
+        norm = cv2.sqrt(cv2.max(variance, 0.0))
+        inv_norm = cv2.divide(1.0, norm)
+        inv_norm[norm <= FLAT_WINDOW_NORM] = 0
+
+        with self.lock:
+            self.inv_window_norms[key] = inv_norm
+            while sum(n.nbytes for n in self.inv_window_norms.values()) > self.norm_cache_bytes and len(self.inv_window_norms) > 1:
+                self.inv_window_norms.popitem(last=False)
+        return inv_norm
+
+class FFTCorrelator(object):
+    # TM_CCOEFF_NORMED of a template bank against a screenshot using the
+    # convolution theorem. The screenshot is transformed once and every
+    # template only costs a spectrum multiplication and an inverse DFT,
+    # instead of cv2.matchTemplate transforming the screenshot again for
+    # every template. The zero mean template spectra are cached per DFT size
+    # as long as they fit in cache_mb (a 1920x1080 spectrum is about 8MB).
+
+    def __init__(self, cache_mb=FFT_CACHE_MB, norm_cache_mb=FFT_NORM_CACHE_MB):
+        self.cache_bytes = cache_mb * 1024 * 1024
+        self.norm_cache_mb = norm_cache_mb
+        self.cached_bytes = 0
+        self.spectra = {}
+        # the matcher threads (--threads, the server's workers) share one
+        # correlator, the cache is only read and changed under this lock
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # locks can't be pickled, worker processes get their own
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def prepare(self, website_img: cv2.Mat) -> ScreenshotSpectrum:
+        return ScreenshotSpectrum(website_img, self.norm_cache_mb)
+
+    def template_spectrum(self, screenshot: ScreenshotSpectrum, template_image: cv2.Mat, key: str):
+        cache_key = (screenshot.dft_rows, screenshot.dft_cols, key)
+        with self.lock:
+            if cache_key in self.spectra:
+                return self.spectra[cache_key]
+
+        trows, tcols = template_image.shape[:2]
+        template = template_image.astype(np.float32)
+        template -= template.mean()
+
+        padded = np.zeros((screenshot.dft_rows, screenshot.dft_cols), np.float32)
+        padded[:trows, :tcols] = template
+        spectrum = (cv2.dft(padded), float(np.sqrt((template * template).sum())))
+
+        with self.lock:
+            # another thread may have computed the same spectrum meanwhile
+            if cache_key in self.spectra:
+                return self.spectra[cache_key]
+            if self.cached_bytes + spectrum[0].nbytes > self.cache_bytes:
+                self.evict(screenshot.dft_rows, screenshot.dft_cols)
+            if self.cached_bytes + spectrum[0].nbytes <= self.cache_bytes:
+                self.spectra[cache_key] = spectrum
+                self.cached_bytes += spectrum[0].nbytes
+
+        return spectrum
+
+    def evict(self, dft_rows: int, dft_cols: int):
+        # make room by dropping the spectra of other DFT sizes, e.g. from
+        # regions of interest of earlier screenshots. called with the lock held
+        for cache_key in list(self.spectra.keys()):
+            if cache_key[:2] != (dft_rows, dft_cols):
+                self.cached_bytes -= self.spectra.pop(cache_key)[0].nbytes
+
+    def correlate(self, screenshot: ScreenshotSpectrum, template_image: cv2.Mat, key: str) -> np.ndarray:
+        # returns the same (rows - trows + 1, cols - tcols + 1) map as
+        # cv2.matchTemplate(website_img, template_image, cv2.TM_CCOEFF_NORMED)
+        trows, tcols = template_image.shape[:2]
+        template_spectrum, template_norm = self.template_spectrum(screenshot, template_image, key)
+
+        # the template has zero mean, so correlating it with the raw
+        # screenshot already gives the numerator of TM_CCOEFF_NORMED
+        product = cv2.mulSpectrums(screenshot.spectrum, template_spectrum, 0, conjB=True)
+        corr = cv2.idft(product, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE)
+        num = corr[:screenshot.rows - trows + 1, :screenshot.cols - tcols + 1]
+
+        if template_norm == 0:
+            return np.zeros(num.shape, np.float32)
+        ncc = cv2.multiply(num, screenshot.inv_window_norm(trows, tcols), scale=1.0 / template_norm)
+
+        # same as cv2.matchTemplate: scores just over 1 from rounding are
+        # clamped, anything further off is 0
+        min_val, max_val, _, _ = cv2.minMaxLoc(ncc)
+        if max_val >= 1.0 or min_val <= -1.0:
+            ncc = np.where(np.abs(ncc) < 1.0, ncc, np.where(np.abs(ncc) < 1.125, np.sign(ncc), 0)).astype(np.float32)
+        return ncc
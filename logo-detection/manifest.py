@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+
+class Manifest(object):
+    # Append-only record of the screenshots a run has processed, one json
+    # object per line:
+    #
+    #   {"path": ..., "size": ..., "mtime": ..., "sidecar": ..., "bank": ..., "params": ..., "status": "done"}
+    #
+    # With --resume, screenshots whose path, size and mtime are unchanged and
+    # that were done with the same template bank and match parameters are
+    # skipped. sidecar, if given, maps a screenshot to a file its result
+    # depends on (the .roi.json of --roi_files). Its size and mtime are part
+    # of the record, so editing, adding or removing it redoes the screenshot. Anything new or changed since (e.g. screenshots the crawler
+    # added to output-DEV) is processed. A run that crashes halfway leaves at
+    # most one partial line, which is ignored.
+
+    def __init__(self, manifest_file: str, bank_key: str, match_params: str, sidecar=None):
+        self.manifest_file = manifest_file
+        self.sidecar = sidecar
+        self.bank_key = bank_key
+        self.params_key = hashlib.sha1(match_params.encode()).hexdigest()
+        self.done = {}
+        self.skipped = 0
+        self._f = None
+
+    def load(self):
+        # only the last record of every path counts
+        self.done = {}
+        if not os.path.exists(self.manifest_file):
+            return
+
+        with open(self.manifest_file) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                if record.get('status') == 'done' and record.get('bank') == self.bank_key and record.get('params') == self.params_key:
+                    sidecar = record.get('sidecar')
+                    self.done[record['path']] = (record['size'], record['mtime'], tuple(sidecar) if sidecar else None)
+                else:
+                    self.done.pop(record.get('path'), None)
+
+    def stat_key(self, path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def file_key(self, image_file: str):
+        key = self.stat_key(image_file)
+        if key is None:
+            return None
+        return key + (self.stat_key(self.sidecar(image_file)) if self.sidecar else None,)
+
+    def pending(self, image_files):
+        # lazily filters out the screenshots that are already done
+        for image_file in image_files:
+            if image_file in self.done and self.done[image_file] == self.file_key(image_file):
+                self.skipped += 1
+                continue
+            yield image_file
+
+    def record(self, image_file: str, status: str):
+        if self._f is None:
+            self._f = open(self.manifest_file, 'a')
+
+        key = self.file_key(image_file) or (None, None, None)
+        record = {'path': image_file, 'size': key[0], 'mtime': key[1], 'sidecar': key[2], 'bank': self.bank_key, 'params': self.params_key, 'status': status}
+        self._f.write(json.dumps(record) + '\n')
+        self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
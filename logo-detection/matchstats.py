@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import threading
+import time
+from contextlib import contextmanager
+
+class MatchStats(object):
+    # Opt-in timers and counters of TemplateMatcher, to see where the time of
+    # a run goes. One instance is passed down through matchfile() / match()
+    # for a single screenshot (the per-image trace) and merged into another
+    # one for the whole run. Times are wall clock seconds.
+    #
+    #   stages:    read, decode, prefilter, grayscale, prepare, match, cache
+    #   providers: time spent on all templates of an oauth provider
+    #   templates: time spent in the matchTemplate / correlation of one template
+    #   counters:  templates_tried, early_exits, templates_skipped,
+    #              cache_hits, cache_misses, prefiltered, deduplicated
+
+    def __init__(self):
+        self.stages = {}      # name -> [count, seconds]
+        self.providers = {}
+        self.templates = {}
+        self.counters = {}
+        self.lock = threading.Lock()   # providers can be matched on several threads
+
+    def add_time(self, group: dict, name: str, seconds: float, count=1):
+        with self.lock:
+            entry = group.setdefault(name, [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+
+    def count(self, name: str, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(self.stages, name, time.perf_counter() - start)
+
+    def to_dict(self) -> dict:
+        # plain json types, so worker processes can send it back
+        with self.lock:
+            return {
+                'stages': {name: list(entry) for name, entry in self.stages.items()},
+                'providers': {name: list(entry) for name, entry in self.providers.items()},
+                'templates': {name: list(entry) for name, entry in self.templates.items()},
+                'counters': dict(self.counters),
+            }
+
+    def merge(self, stats: dict):
+        # adds up the to_dict() of another screenshot or process
+        for group_name in ['stages', 'providers', 'templates']:
+            group = getattr(self, group_name)
+            for name, (count, seconds) in stats.get(group_name, {}).items():
+                self.add_time(group, name, seconds, count)
+        for name, n in stats.get('counters', {}).items():
+            self.count(name, n)
+
+    def summary(self, images: int, top=20) -> dict:
+        # the per-run json summary, with the most expensive providers and
+        # templates first
+        def timers(group, limit=None):
+            ranked = sorted(group.items(), key=lambda item: -item[1][1])[:limit]
+            return [{'name': name, 'count': count, 'seconds': round(seconds, 4), 'ms_per_call': round(seconds * 1000 / count, 3) if count else None}
+                    for name, (count, seconds) in ranked]
+
+        with self.lock:
+            return {
+                'images': images,
+                'stages': timers(self.stages),
+                'providers': timers(self.providers),
+                'templates': timers(self.templates, top),
+                'counters': dict(self.counters),
+            }
+
+class NullStats(object):
+    # stands in for MatchStats when nothing is collected, so the matcher
+    # doesn't need an if around every timer
+
+    def add_time(self, group, name, seconds, count=1):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+NO_STATS = NullStats()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+RESULT_CACHE_FILE = 'templatematch-cache.sqlite'   # default location of the result cache
+
+class ResultCache(object):
+    # On-disk cache of template matching results, keyed by the sha1 of the
+    # screenshot bytes and a string describing everything else that can
+    # change the result (template bank, thresholds, matching mode, ...).
+    # Byte-identical screenshots, e.g. the same site crawled from different
+    # countries, only get matched once.
+
+    def __init__(self, cache_file: str = RESULT_CACHE_FILE):
+        self.cache_file = cache_file
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # sqlite connections can't be shared with worker processes or
+        # threads, each one opens its own
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.cache_file, timeout=60, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS results (image_hash TEXT NOT NULL, params TEXT NOT NULL, matches TEXT NOT NULL, prefiltered INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (image_hash, params))')
+            if 'prefiltered' not in [column[1] for column in conn.execute('PRAGMA table_info(results)')]:
+                # cache files written before the prefilter flag was stored
+                conn.execute('ALTER TABLE results ADD COLUMN prefiltered INTEGER NOT NULL DEFAULT 0')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def image_hash(self, image_data: bytes) -> str:
+        return hashlib.sha1(image_data).hexdigest()
+
+    def get(self, image_hash: str, params: str):
+        # returns (list of match dicts, prefiltered), or None on a miss.
+        # prefiltered is True if the prefilter skipped the screenshot
+        row = self.connection().execute('SELECT matches, prefiltered FROM results WHERE image_hash = ? AND params = ?', (image_hash, params)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return (json.loads(row[0]), bool(row[1]))
+
+    def put(self, image_hash: str, params: str, matches: list[dict], prefiltered=False):
+        self.connection().execute('INSERT OR REPLACE INTO results (image_hash, params, matches, prefiltered) VALUES (?, ?, ?, ?)', (image_hash, params, json.dumps(matches), int(prefiltered)))
+
+    def close(self):
+        # closes the connection of the calling thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
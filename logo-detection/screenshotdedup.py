@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+DHASH_SIZE = 16            # the difference hash has DHASH_SIZE * DHASH_SIZE bits
+DEDUP_MAX_DISTANCE = 6     # screenshots whose hashes differ in at most this many bits are near-duplicates
+DEDUP_BATCH = 1000         # screenshots hashed and grouped before the new groups are matched
+
+# Groups near-identical login screenshots, e.g. several crawled domains that
+# redirect to the same accounts.* login page, so logo detection only has to
+# run once per group. Every screenshot gets a difference hash of a small
+# thumbnail. A screenshot joins the first group whose representative (the
+# first screenshot of the group) has the same size and a hash at most
+# max_distance bits away, otherwise it starts a new group.
+#
+# Re-encoding a screenshot changes about 5 bits, the closest two different
+# pages of test-data are 12 bits apart. A different button on an otherwise
+# identical page only changes a few bits, which is the price of the dedup.
+#
+#   ./screenshotdedup.py output-DEV/ > groups.jsonl
+
+def dhash(website_img: cv2.Mat, size=DHASH_SIZE) -> int:
+    # is every pixel of a (size + 1) x size grayscale thumbnail brighter
+    # than its left neighbour
+    small = cv2.resize(website_img, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming(hash_a: int, hash_b: int) -> int:
+    return bin(hash_a ^ hash_b).count('1')
+
+def hash_file(image_file: str) -> tuple:
+    # returns ((rows, cols), dhash), or None if the screenshot can't be read
+    website_img = cv2.imread(image_file, cv2.IMREAD_GRAYSCALE)
+    if website_img is None:
+        return None
+    return (website_img.shape[:2], dhash(website_img))
+
+class ScreenshotGroups(object):
+    # Two hashes at most max_distance bits apart are equal in at least one
+    # of max_distance + 1 bands of bits, so a new hash is only compared
+    # against the representatives sharing one of its bands instead of all
+    # of them.
+
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE, bits=DHASH_SIZE * DHASH_SIZE):
+        self.max_distance = max_distance
+        band_bits = -(-bits // (max_distance + 1))
+        self.bands = [(shift, (1 << band_bits) - 1) for shift in range(0, bits, band_bits)]
+        self.index = defaultdict(list)   # (size, band, band value) -> representatives
+        self.hashes = {}                 # representative -> (size, hash)
+        self.representative = {}         # duplicate -> representative
+
+    def add(self, image_file: str, image_hash: tuple) -> str:
+        # returns the representative of the group image_file joins, which is
+        # image_file itself if it starts a new group
+        if image_file in self.hashes:
+            return image_file   # listed twice
+
+        size, h = image_hash
+        keys = [(size, i, (h >> shift) & mask) for i, (shift, mask) in enumerate(self.bands)]
+        for key in keys:
+            for representative in self.index.get(key, []):
+                if hamming(self.hashes[representative][1], h) <= self.max_distance:
+                    self.representative[image_file] = representative
+                    return representative
+
+        self.hashes[image_file] = image_hash
+        for key in keys:
+            self.index[key].append(image_file)
+        return image_file
+
+    def groups(self) -> dict[str, list]:
+        # representative -> duplicates, only groups with duplicates
+        groups = defaultdict(list)
+        for image_file, representative in self.representative.items():
+            groups[representative].append(image_file)
+        return groups
+
+if __name__ == '__main__':
+    from templatematch import expand_image_paths
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("webpage_paths", type=str, nargs='+', help="Screenshots to group. Directories are searched for *-1.png files.")
+    parser.add_argument("--max_distance", type=int, default=DEDUP_MAX_DISTANCE, help="Max number of differing hash bits of near-duplicates")
+    args = parser.parse_args()
+
+    groups = ScreenshotGroups(args.max_distance)
+    image_files = expand_image_paths(args.webpage_paths)
+    for image_file in image_files:
+        image_hash = hash_file(image_file)
+        if image_hash is None:
+            sys.stderr.write("%s: can't read the screenshot\n" % image_file)
+            continue
+        groups.add(image_file, image_hash)
+
+    for representative, duplicates in groups.groups().items():
+        print(json.dumps({'representative': representative, 'duplicates': duplicates}))
+
+    sys.stderr.write("%d screenshots, %d groups, %d near-duplicates\n" % (len(image_files), len(groups.hashes), len(groups.representative)))
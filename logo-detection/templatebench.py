@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import templatematch
+from templatematch import TemplateMatcher, PREFILTER_MIN_PIXELS
+from fftmatch import FFTCorrelator, fft_cache_budget
+
+# Throughput and latency benchmark of TemplateMatcher, to catch regressions
+# before a big crawl is matched. Every matching mode / worker count runs in
+# its own process, so startup and peak memory aren't shared between runs.
+# Prints one json record per run:
+#
+#   {"mode": "pyramid", "workers": 4, "images": 1000, "images_per_sec": ...,
+#    "p50_ms": ..., "p95_ms": ..., "startup_ms": ..., "peak_rss_mb": ..., ...}
+#
+#   ./templatebench.py --template_dir templates --modes exhaustive,pyramid --workers 1,4 --images 10000
+
+MODES = {
+    'exhaustive': {},
+    'pyramid': {'pyramid': True},
+    'fft': {'fft': True},
+}
+
+BENCH_IMAGES = ['test-data/sso/*.png', 'test-data/no_sso/*.png']
+
+def bench_images(patterns: list[str], count=None) -> list[str]:
+    # count repeats the images (in order) to get a bigger synthetic set
+    image_files = sorted(itertools.chain.from_iterable(glob.glob(pattern) for pattern in patterns))
+    if count and image_files:
+        image_files = list(itertools.islice(itertools.cycle(image_files), count))
+    return image_files
+
+def _timed_task(task: tuple[str, list]):
+    # runs in the worker processes, see templatematch._match_worker
+    start = time.perf_counter()
+    image_file, matches, error, prefiltered, stats = templatematch._match_worker(task)
+    return (len(matches), error, time.perf_counter() - start)
+
+def run_benchmark(template_dir: str, image_files: list[str], mode='exhaustive', workers=1, bank_file=True, prefilter_min_pixels=None) -> dict:
+    start = time.perf_counter()
+    matcher = TemplateMatcher(template_dir, bank_file=bank_file, prefilter_min_pixels=prefilter_min_pixels, **MODES[mode])
+    startup = time.perf_counter() - start
+    if matcher.fft and workers > 1:
+        matcher.fft_correlator = FFTCorrelator(*fft_cache_budget(workers))
+
+    tasks = [(image_file, None) for image_file in image_files]
+
+    start = time.perf_counter()
+    # set directly, _init_worker() keeps the matcher of an earlier run
+    templatematch._worker_matcher = matcher
+    if workers <= 1:
+        results = [_timed_task(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(workers, initializer=templatematch._init_worker, initargs=(matcher,)) as pool:
+            results = pool.map(_timed_task, tasks, chunksize=1)
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for _, _, latency in results]) * 1000
+    return {
+        'mode': mode,
+        'workers': workers,
+        'prefilter': prefilter_min_pixels,
+        'images': len(image_files),
+        'seconds': round(elapsed, 3),
+        'images_per_sec': round(len(image_files) / elapsed, 3) if elapsed > 0 else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+        'p95_ms': round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+        'startup_ms': round(startup * 1000, 1),
+        'matches': sum(count for count, _, _ in results),
+        'errors': sum(1 for _, error, _ in results if error),
+        # ru_maxrss is in KB on linux. the workers are the largest child
+        # process, not the sum of all of them.
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'worker_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1) if workers > 1 else None,
+    }
+
+def _run_isolated(queue: multiprocessing.Queue, *args, **kwargs):
+    queue.put(run_benchmark(*args, **kwargs))
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image_patterns", type=str, nargs='*', default=BENCH_IMAGES, help="Screenshots to match (globs). Defaults to %s." % ' '.join(BENCH_IMAGES))
+    parser.add_argument("--template_dir", required=True, type=str, help="The directory of logo template images")
+    parser.add_argument("--modes", type=str, default='exhaustive,pyramid', help="Comma separated matching modes: %s" % ','.join(MODES))
+    parser.add_argument("--workers", type=str, default='1', help="Comma separated worker counts")
+    parser.add_argument("--images", type=int, help="Repeat the screenshots up to this many images, e.g. 10000 for a synthetic crawl")
+    parser.add_argument("--prefilter", nargs='?', type=int, const=PREFILTER_MIN_PIXELS, help="Run with the brand color prefilter (default: %d)" % PREFILTER_MIN_PIXELS)
+    parser.add_argument("--no_bank", help="Measure startup without the template bank", action="store_true")
+    parser.add_argument("--output", type=str, help="Also append the json records to this file")
+    args = parser.parse_args()
+
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in MODES:
+            parser.error("unknown mode %s" % mode)
+    worker_counts = [int(w) for w in args.workers.split(',')]
+
+    image_files = bench_images(args.image_patterns, args.images)
+    if not image_files:
+        parser.error("no images found")
+
+    # build the template bank once, so startup_ms is the warm startup
+    if not args.no_bank:
+        TemplateMatcher(args.template_dir)
+
+    context = {'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'host': platform.node(), 'cpus': os.cpu_count()}
+
+    for mode, workers in itertools.product(modes, worker_counts):
+        queue = multiprocessing.Queue()
+        p = multiprocessing.Process(target=_run_isolated, args=(queue, args.template_dir, image_files, mode, workers), kwargs={'bank_file': None if args.no_bank else True, 'prefilter_min_pixels': args.prefilter})
+        p.start()
+        result = queue.get()
+        p.join()
+
+        record = dict(context, **result)
+        print(json.dumps(record))
+        sys.stdout.flush()
+        if args.output:
+            with open(args.output, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+        sys.stderr.write("%-10s workers=%-2d %8.2f img/s  p50 %8.1f ms  p95 %8.1f ms  startup %6.1f ms  rss %6.1f MB\n" % (
+            mode, workers, result['images_per_sec'], result['p50_ms'], result['p95_ms'], result['startup_ms'], result['peak_rss_mb']))
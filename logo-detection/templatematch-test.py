@@ -2,7 +2,25 @@
 import unittest
 import os
 import glob
-from templatematch import TemplateMatcher
+import shutil
+import tempfile
+import numpy as np
+import io
+import json
+import threading
+import http.client
+from collections import Counter
+import cv2
+import templatematch
+from templatematch import TemplateMatcher, imread_grayscale, imread_color, read_image_paths, brand_color_pixels, nms, dedup_match_files, PREFILTER_MIN_PIXELS, SCALE_PROBE_PROVIDERS, SCALE_PROBE_CONFIRM
+from resultcache import ResultCache
+from templateserver import MatchService, make_server
+from manifest import Manifest
+from templateorder import build_template_order
+from templatebench import run_benchmark, bench_images
+from matchstats import MatchStats
+from fftmatch import FFTCorrelator, fft_cache_budget, FFT_CACHE_MB, FFT_NORM_CACHE_MB, FFT_MEMORY_FRACTION
+from screenshotdedup import ScreenshotGroups, hash_file, hamming
 
 class TemplateMatchTest(unittest.TestCase):
 
@@ -91,11 +109,380 @@ class TemplateMatchTest(unittest.TestCase):
     def test_webtoons(self):
         self.assert_expected("webtoons.png", ["facebook", "google", "apple", "twitter"])
 
-    def assert_expected(self, test_image_name: str, expected_oauth_list: list[str]):
+    def test_template_bank(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bank_file = os.path.join(tmp_dir, "bank.npz")
+            built = TemplateMatcher("templates/", bank_file=bank_file)
+            self.assertTrue(os.path.exists(bank_file))
+
+            loaded = TemplateMatcher("templates/", bank_file=bank_file)
+            uncached = TemplateMatcher("templates/", bank_file=None)
+            for matcher in [built, loaded]:
+                self.assertEqual(list(uncached.logo_images.keys()), list(matcher.logo_images.keys()))
+                for oauth_provider, image_list in uncached.logo_images.items():
+                    for (name, image), (other_name, other_image) in zip(image_list, matcher.logo_images[oauth_provider]):
+                        self.assertEqual(name, other_name)
+                        self.assertTrue(np.array_equal(image, other_image))
+
+            # changing a template invalidates the bank
+            template_dir = os.path.join(tmp_dir, "templates")
+            shutil.copytree("templates/", template_dir)
+            before = TemplateMatcher(template_dir)
+            shutil.copy(os.path.join(template_dir, "google-0.jpg"), os.path.join(template_dir, "google-1.jpg"))
+            after = TemplateMatcher(template_dir)
+            self.assertNotEqual(before.bank_key, after.bank_key)
+            google = dict(after.logo_images["google"])
+            self.assertTrue(np.array_equal(google["google-0.jpg"], google["google-1.jpg"]))
+
+    def test_pyramid(self):
+        pyramid_matcher = TemplateMatcher("templates/", pyramid=True)
+
+        # the coarse scores of these are the lowest in test-data/sso
+        self.assert_expected("stackoverflow.png", ["google", "github", "facebook"], pyramid_matcher)
+        self.assert_expected("medium.png", ["google", "apple", "facebook", "twitter"], pyramid_matcher)
+        self.assert_expected("spotify.png", ["facebook", "apple", "google"], pyramid_matcher)
+
+        for test_image in glob.glob(os.path.join("test-data/no_sso/", "*.png"))[:3]:
+            exhaustive = set([x.oauth_provider for x in self.matcher.matchfile(test_image)])
+            pyramid = set([x.oauth_provider for x in pyramid_matcher.matchfile(test_image)])
+            self.assertSetEqual(exhaustive, pyramid)
+
+    def test_template_order(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            hits = {"facebook-2.jpg": 10, "linkedin-2.jpg": 3}
+            template_order = build_template_order(self.matcher.logo_images, Counter(hits))
+
+            # most hits first, near-duplicates of a kept template are dropped
+            self.assertEqual("facebook-2.jpg", template_order["order"]["facebook"][0])
+            self.assertEqual("linkedin-2.jpg", template_order["dropped"]["linkedin-0.jpg"])
+
+            order_file = os.path.join(tmp_dir, "order.json")
+            with open(order_file, "w") as f:
+                json.dump(template_order, f)
+            ordered_matcher = TemplateMatcher("templates/", order_file=order_file)
+            self.assertEqual("facebook-2.jpg", ordered_matcher.logo_images["facebook"][0][0])
+            self.assertNotIn("linkedin-0.jpg", dict(ordered_matcher.logo_images["linkedin"]))
+            self.assertNotEqual(self.matcher.match_params(None), ordered_matcher.match_params(None))
+
+            self.assert_expected("spotify.png", ["facebook", "apple", "google"], ordered_matcher)
+
+            # the order file in the template dir is only used when asked for
+            template_dir = os.path.join(tmp_dir, "templates")
+            shutil.copytree("templates/", template_dir)
+            shutil.copy(order_file, os.path.join(template_dir, "templateorder.json"))
+            self.assertIsNone(TemplateMatcher(template_dir).template_order)
+            self.assertEqual(template_order, TemplateMatcher(template_dir, order_file=True).template_order)
+
+    def test_prefilter(self):
+        # the default threshold must not skip any known positive
+        for test_image in glob.glob(os.path.join("test-data/sso/", "*.png")):
+            image = imread_color(test_image)
+            self.assertGreaterEqual(brand_color_pixels(image), PREFILTER_MIN_PIXELS, test_image)
+
+        prefilter_matcher = TemplateMatcher("templates/", prefilter_min_pixels=PREFILTER_MIN_PIXELS)
+        self.assertEqual([], prefilter_matcher.matchfile(glob.glob("test-data/no_sso/*craigslist*.png")[0]))
+        self.assertEqual(1, prefilter_matcher.prefiltered)
+        self.assertIsNone(brand_color_pixels(imread_grayscale("test-data/sso/spotify.png")))
+
+    def test_dedup(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # the same page saved as a jpeg in between is a near-duplicate
+            image = cv2.imread("test-data/sso/spotify.png")
+            recompressed = cv2.imdecode(cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 60])[1], cv2.IMREAD_COLOR)
+            cv2.imwrite(os.path.join(tmp_dir, "spotify-copy.png"), recompressed)
+
+            image_files = ["test-data/sso/spotify.png", "test-data/sso/medium.png", os.path.join(tmp_dir, "spotify-copy.png")]
+            self.assertLess(hamming(hash_file(image_files[0])[1], hash_file(image_files[2])[1]), hamming(hash_file(image_files[0])[1], hash_file(image_files[1])[1]))
+
+            groups = ScreenshotGroups()
+            results = {image_file: matches for image_file, matches, error, prefiltered, stats in dedup_match_files(self.matcher, image_files, groups, batch_size=2)}
+            self.assertEqual({image_files[2]: image_files[0]}, groups.representative)
+            self.assertEqual(set(image_files), set(results))
+            self.assertEqual(results[image_files[0]], results[image_files[2]])
+            self.assertNotEqual(results[image_files[0]], results[image_files[1]])
+
+    def test_benchmark(self):
+        image_files = bench_images(["test-data/sso/spotify.png", "test-data/no_sso/*usps*.png"], 3)
+        self.assertEqual(3, len(image_files))
+
+        result = run_benchmark("templates/", image_files, mode="pyramid")
+        self.assertEqual(3, result["images"])
+        self.assertEqual(0, result["errors"])
+        self.assertEqual(3, result["matches"])   # usps, spotify, usps
+        self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+
+        # a second run in the same process times its own mode, not the first matcher
+        run_benchmark("templates/", image_files[:1], mode="fft")
+        self.assertTrue(templatematch._worker_matcher.fft)
+
+    def test_match_stats(self):
+        for threads in [1, 2]:
+            matcher = TemplateMatcher("templates/", pyramid=True, threads=threads)
+            stats = MatchStats()
+            results = matcher.matchfile("test-data/sso/spotify.png", stats=stats)
+
+            self.assertEqual(3, len(results))
+            self.assertEqual(3, stats.counters["early_exits"])
+            templates = sum(len(image_list) for image_list in matcher.logo_images.values())
+            self.assertEqual(templates, stats.counters["templates_tried"] + stats.counters["templates_skipped"])
+            self.assertEqual(set(matcher.logo_images.keys()), set(stats.providers.keys()))
+            self.assertEqual(stats.counters["templates_tried"], sum(count for count, _ in stats.templates.values()))
+
+            summary = stats.summary(1)
+            self.assertEqual(["decode", "grayscale", "match", "prepare"], sorted(stage["name"] for stage in summary["stages"]))
+
+            merged = MatchStats()
+            merged.merge(stats.to_dict())
+            merged.merge(stats.to_dict())
+            self.assertEqual(2 * stats.counters["templates_tried"], merged.counters["templates_tried"])
+
+    def test_tiles(self):
+        tiled_matcher = TemplateMatcher("templates/", tile_rows=300)
+
+        image = np.zeros((1000, 50), np.uint8)
+        tiles = tiled_matcher.tile_regions([(0, 0, image)])
+        self.assertEqual([0, 300, 600, 900], [y for (_, y, _) in tiles][:4])
+        self.assertEqual(1000, tiles[-1][1] + tiles[-1][2].shape[0])
+        for (_, y, tile) in tiles:
+            self.assertLessEqual(tile.shape[0], 300 + tiled_matcher.tile_overlap)
+
+        test_image = "test-data/sso/spotify.png"
+        expected = [(x.oauth_provider, x.template_img_name, x.match_x, x.match_y) for x in self.matcher.matchfile(test_image)]
+        self.assertEqual(expected, [(x.oauth_provider, x.template_img_name, x.match_x, x.match_y) for x in tiled_matcher.matchfile(test_image)])
+
+    def test_multi(self):
+        self.assertEqual([1], nms([(0, 0, 10, 10), (1, 1, 10, 10)], [0.95, 0.99]))
+        self.assertEqual([0, 2], nms([(0, 0, 10, 10), (1, 1, 10, 10), (30, 30, 10, 10)], [0.99, 0.95, 0.93]))
+
+        # two copies of the same page, every button is found twice
+        image = imread_grayscale("test-data/sso/spotify.png")
+        image = np.vstack([image, image])
+        for matcher in [TemplateMatcher("templates/", pyramid=True, multi=True), TemplateMatcher("templates/", pyramid=True, multi=True, tile_rows=500)]:
+            results = matcher.match(image)
+            self.assertEqual(["apple", "apple", "facebook", "facebook", "google", "google"], sorted(x.oauth_provider for x in results))
+            for provider in ["apple", "facebook", "google"]:
+                boxes = sorted((x.match_x, x.match_y) for x in results if x.oauth_provider == provider)
+                self.assertEqual(boxes[0][0], boxes[1][0])
+                self.assertEqual(image.shape[0] // 2, boxes[1][1] - boxes[0][1])
+
+    def test_scale_prior(self):
+        # the page zoomed in 1.3x, bigger than any template of the bank
+        image = imread_grayscale("test-data/sso/latimes.png")
+        image = cv2.resize(image, (0,0), fx=1.3, fy=1.3)
+        matcher = TemplateMatcher("templates/", pyramid=True, scale_prior=True)
+        results = matcher.match(image)
+        self.assertEqual(["apple", "facebook", "google", "microsoft", "twitter", "yahoo"], sorted(x.oauth_provider for x in results))
+        # the bank only finds facebook, its height is the prior for the others
+        self.assertEqual(["facebook"], [x.oauth_provider for x in results if "@" not in x.template_img_name])
+
+        # at the normal size the same as without the prior: the bank matches
+        # give the logo height, no scale is probed blindly and the missing
+        # providers cost less than half again the templates of the bank
+        bank_matcher = TemplateMatcher("templates/", pyramid=True)
+        for test_image in ["test-data/sso/spotify.png", "test-data/sso/baseball-reference.png"]:
+            bank_stats = MatchStats()
+            stats = MatchStats()
+            self.assertEqual(sorted(x.oauth_provider for x in bank_matcher.matchfile(test_image, stats=bank_stats)),
+                             sorted(x.oauth_provider for x in matcher.matchfile(test_image, stats=stats)))
+            self.assertNotIn("scale_probes", stats.counters, test_image)
+            self.assertLess(stats.counters["templates_tried"], 1.5 * bank_stats.counters["templates_tried"], test_image)
+
+        # without any match the probe providers are tried at every ladder
+        # scale on the downsampled page only, and at most
+        # SCALE_PROBE_CONFIRM scales at full resolution
+        no_sso_image = glob.glob("test-data/no_sso/*craigslist*.png")[0]
+        bank_stats = MatchStats()
+        stats = MatchStats()
+        self.assertEqual([], bank_matcher.matchfile(no_sso_image, stats=bank_stats))
+        self.assertEqual([], matcher.matchfile(no_sso_image, stats=stats))
+        self.assertEqual(len(matcher.ladder_scales()) * len(SCALE_PROBE_PROVIDERS), stats.counters["scale_probes"])
+        self.assertLessEqual(stats.counters["templates_tried"], bank_stats.counters["templates_tried"] + SCALE_PROBE_CONFIRM * len(SCALE_PROBE_PROVIDERS))
+
+        # strips overlap by the tallest ladder template, not only the bank's
+        tiled_matcher = TemplateMatcher("templates/", scale_prior=True, tile_rows=300)
+        template_image = dict(tiled_matcher.all_templates())["twitter-8.jpg@1.50"]
+        self.assertGreater(template_image.shape[0] - 1, max(x.shape[0] for image_list in tiled_matcher.logo_images.values() for _, x in image_list) - 1)
+        self.assertGreaterEqual(tiled_matcher.tile_overlap, template_image.shape[0] - 1)
+        # a bank logo gives the height of a ladder logo across a strip border
+        bank_image = dict(tiled_matcher.all_templates())["facebook-13.jpg"]
+        ladder_image = dict(tiled_matcher.all_templates())["twitter-8.jpg@1.20"]
+        self.assertGreater(ladder_image.shape[0], bank_image.shape[0])
+        page = np.full((900, 1200), 255, np.uint8)
+        page[50:50 + bank_image.shape[0], 100:100 + bank_image.shape[1]] = bank_image
+        page[595:595 + ladder_image.shape[0], 400:400 + ladder_image.shape[1]] = ladder_image
+        self.assertEqual([("facebook", 50), ("twitter", 595)], sorted((x.oauth_provider, x.match_y) for x in tiled_matcher.match(page)))
+
+        with self.assertRaises(ValueError):
+            TemplateMatcher("templates/", scale_prior=True, multi=True)
+
+    def test_fft(self):
+        fft_matcher = TemplateMatcher("templates/", fft=True)
+
+        for test_image in ["test-data/sso/spotify.png", "test-data/sso/medium.png"]:
+            exhaustive = self.matcher.matchfile(test_image)
+            fft = fft_matcher.matchfile(test_image)
+            self.assertEqual([(x.oauth_provider, x.template_img_name, x.match_x, x.match_y) for x in exhaustive], [(x.oauth_provider, x.template_img_name, x.match_x, x.match_y) for x in fft])
+            for a, b in zip(exhaustive, fft):
+                self.assertAlmostEqual(a.confidence, b.confidence, places=4)
+
+        # threads share the correlator, a small cache makes them evict each other's spectra
+        threaded_matcher = TemplateMatcher("templates/", fft=True, threads=4)
+        threaded_matcher.fft_correlator = FFTCorrelator(cache_mb=40)
+        for test_image in ["test-data/sso/spotify.png", "test-data/sso/medium.png", "test-data/sso/spotify.png"]:
+            self.assertEqual([x.to_dict() for x in fft_matcher.matchfile(test_image)], [x.to_dict() for x in threaded_matcher.matchfile(test_image)])
+        correlator = threaded_matcher.fft_correlator
+        self.assertEqual(sum(spectrum.nbytes for spectrum, _ in correlator.spectra.values()), correlator.cached_bytes)
+
+        # the caches of all workers stay within a fraction of the available memory
+        self.assertEqual((FFT_CACHE_MB, FFT_NORM_CACHE_MB), fft_cache_budget(1, available_mb=64 * 1024))
+        cache_mb, norm_cache_mb = fft_cache_budget(8, available_mb=2048)
+        self.assertLessEqual(8 * (cache_mb + norm_cache_mb), 2048 * FFT_MEMORY_FRACTION)
+
+    def test_threads(self):
+        serial_matcher = TemplateMatcher("templates/", pyramid=True)
+        threaded_matcher = TemplateMatcher("templates/", pyramid=True, threads=4)
+
+        for test_image in ["test-data/sso/spotify.png", "test-data/sso/medium.png"]:
+            serial = [x.to_dict() for x in serial_matcher.matchfile(test_image)]
+            threaded = [x.to_dict() for x in threaded_matcher.matchfile(test_image)]
+            self.assertEqual(serial, threaded)
+
+    def test_match_service(self):
+        service = MatchService(TemplateMatcher("templates/", pyramid=True), workers=2, queue_size=1)
+
+        with open("test-data/sso/spotify.png", "rb") as f:
+            image_data = f.read()
+
+        results = service.match_batch(["test-data/sso/spotify.png", "test-data/sso/missing.png"], [image_data])
+        self.assertEqual(3, len(results))
+        self.assertSetEqual(set(["facebook", "apple", "google"]), set([x["oauth_provider"] for x in results[0]["matches"]]))
+        self.assertIn("error", results[1])
+        self.assertEqual(results[0]["matches"], results[2]["matches"])
+        self.assertEqual(3, service.matched)
+
+    def test_match_service_bad_request(self):
+        service = MatchService(TemplateMatcher("templates/"), workers=1)
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            for length in ["abc", "-1"]:
+                conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+                conn.putrequest("POST", "/match")
+                conn.putheader("Content-Length", length)
+                conn.endheaders()
+                response = conn.getresponse()
+                self.assertEqual(400, response.status)
+                self.assertIn("error", json.loads(response.read()))
+                conn.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_read_image_paths(self):
+        stream = io.StringIO(
+            "outputPrefix,timestamp,url,login_url,screenshot_url,screenshot_login_url,html_url,html_login_url,1st,amazon,apple,github,google,facebook,linkedin,microsoft,twitter,yahoo\n"
+            "1000,2023-02-01T08:16:06.452Z,https://ok.ru,https://ok.ru/dk,1000-https!ok.ru-20230201081606453-0.png,1000-https!ok.ru-20230201081606453-1.png,1000-https!ok.ru-20230201081606453-0.html.gz,1000-https!ok.ru-20230201081606453-1.html.gz,1,0,0,0,1,1,0,0,0,0\n"
+            "1000,2023-02-01T08:16:07.452Z,https://vk.com,https://vk.com/login?a=1,b=2,1000-https!vk.com-20230201081607453-0.png,1000-https!vk.com-20230201081607453-1.png,1000-https!vk.com-20230201081607453-0.html.gz,1000-https!vk.com-20230201081607453-1.html.gz,1,0,0,0,0,0,0,0,0,0\n"
+            "\n"
+            "test-data/sso/spotify.png\n")
+        self.assertEqual(["crawl/1000-https!ok.ru-20230201081606453-1.png", "crawl/1000-https!vk.com-20230201081607453-1.png", "test-data/sso/spotify.png"], list(read_image_paths(stream, "crawl")))
+
+    def test_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest_file = os.path.join(tmp_dir, "manifest.jsonl")
+            images = [os.path.join(tmp_dir, name) for name in ["a-1.png", "b-1.png", "c-1.png"]]
+            for image in images:
+                shutil.copy("test-data/sso/spotify.png", image)
+
+            manifest = Manifest(manifest_file, "bank", "params")
+            manifest.record(images[0], "done")
+            manifest.record(images[1], "done")
+            manifest.record(images[2], "error")
+            manifest.close()
+
+            # b changed since, c failed
+            os.utime(images[1], ns=(0, 0))
+
+            resumed = Manifest(manifest_file, "bank", "params")
+            resumed.load()
+            self.assertEqual(images[1:], list(resumed.pending(images)))
+            self.assertEqual(1, resumed.skipped)
+
+            # different templates or settings redo everything
+            for other in [Manifest(manifest_file, "other bank", "params"), Manifest(manifest_file, "bank", "other params")]:
+                other.load()
+                self.assertEqual(images, list(other.pending(images)))
+
+            # with a sidecar, a screenshot is redone when its .roi.json is added or edited
+            roi_file = templatematch.roi_filename(images[0])
+            sidecar_manifest = Manifest(manifest_file, "bank", "roi params", sidecar=templatematch.roi_filename)
+            with open(roi_file, "w") as f:
+                json.dump([[830, 180, 260, 150]], f)
+            sidecar_manifest.record(images[0], "done")
+            sidecar_manifest.close()
+
+            resumed = Manifest(manifest_file, "bank", "roi params", sidecar=templatematch.roi_filename)
+            resumed.load()
+            self.assertEqual(images[1:], list(resumed.pending(images)))
+
+            with open(roi_file, "w") as f:
+                json.dump([[0, 0, 100, 100], [830, 180, 260, 150]], f)
+            resumed = Manifest(manifest_file, "bank", "roi params", sidecar=templatematch.roi_filename)
+            resumed.load()
+            self.assertEqual(images, list(resumed.pending(images)))
+
+    def test_roi(self):
+        test_image = "test-data/sso/spotify.png"
+
+        # the spotify buttons are stacked around x=830..1090, y=180..330
+        results = self.matcher.matchfile(test_image, rois=[(830, 180, 260, 150)])
+        self.assertSetEqual(set(["facebook", "apple", "google"]), set([x.oauth_provider for x in results]))
+        locations = dict([(x.oauth_provider, (x.match_x, x.match_y)) for x in results])
+        self.assertEqual((838, 304), locations["google"])
+
+        # nothing in the bottom right corner
+        results = self.matcher.matchfile(test_image, rois=[(1700, 900, 10, 10)])
+        self.assertEqual(0, len(results))
+
+    def test_imread_grayscale(self):
+        # must match how screenshots were converted before, or detections change
+        for test_image in ["test-data/sso/spotify.png", "test-data/no_sso/1000-https_clients.mindbodyonline.com-20230201090909943-1.png"]:
+            expected = cv2.cvtColor(cv2.imread(test_image), cv2.COLOR_BGR2GRAY)
+            self.assertTrue(np.array_equal(expected, imread_grayscale(test_image)))
+            # alpha is stripped while decoding, not kept in a 4 channel buffer
+            self.assertEqual(3, imread_color(test_image).shape[2])
+
+    def test_result_cache(self):
+        test_image = "test-data/sso/spotify.png"
+        rois = [(830, 180, 260, 150)]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result_cache = ResultCache(os.path.join(tmp_dir, "cache.sqlite"))
+            matcher = TemplateMatcher("templates/", result_cache=result_cache)
+
+            first = matcher.matchfile(test_image, rois)
+            second = matcher.matchfile(test_image, rois)
+            self.assertEqual((1, 1), (result_cache.hits, result_cache.misses))
+            self.assertEqual([x.to_dict() for x in first], [x.to_dict() for x in second])
+
+            # different regions are a different cache entry
+            matcher.matchfile(test_image, [(1700, 900, 10, 10)])
+            self.assertEqual((1, 2), (result_cache.hits, result_cache.misses))
+
+            # a screenshot the prefilter skipped is counted as skipped on a hit too
+            no_sso_image = glob.glob("test-data/no_sso/*craigslist*.png")[0]
+            prefilter_matcher = TemplateMatcher("templates/", result_cache=result_cache, prefilter_min_pixels=PREFILTER_MIN_PIXELS)
+            self.assertEqual([], prefilter_matcher.matchfile(no_sso_image))
+            self.assertEqual([], prefilter_matcher.matchfile(no_sso_image))
+            self.assertEqual((2, 3), (result_cache.hits, result_cache.misses))
+            self.assertEqual(2, prefilter_matcher.prefiltered)
+
+    def assert_expected(self, test_image_name: str, expected_oauth_list: list[str], matcher=None):
         print("")
         print("\ttesting %s contains %s" % (test_image_name, ', '.join(expected_oauth_list)))
 
-        results = self.matcher.matchfile("test-data/sso/" + test_image_name)
+        matcher = matcher or self.matcher
+        results = matcher.matchfile("test-data/sso/" + test_image_name)
 
         oauth_results = set([x.oauth_provider for x in results])
         expeected_results = set(expected_oauth_list)
@@ -6,14 +6,43 @@ import cv2
 import sys
 import os
 import glob
+import itertools
+import hashlib
 import numpy as np
 import argparse
+import json
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from cv2 import Mat
+from resultcache import ResultCache, RESULT_CACHE_FILE
+from manifest import Manifest
+from matchstats import MatchStats, NO_STATS
+from fftmatch import FFTCorrelator, fft_cache_budget, FFT_CACHE_MB
+from templateorder import TEMPLATE_ORDER_FILE, load_template_order, apply_template_order
+from screenshotdedup import ScreenshotGroups, hash_file, DEDUP_MAX_DISTANCE, DEDUP_BATCH
 
 SCALE_FACTOR = 0.05       # decrease step size for generating smaller images
 SCALE_VERSIONS = 3       # number of scaled images to generate for each template
 DETECTION_THRESH = 0.05   # max detection threshold. closer to 0 is better when using cv2.TM_SQDIFF_NORMED
+MATCH_THRESH = 0.92       # min detection threshold for cv2.TM_CCOEFF_NORMED
+PYRAMID_FACTOR = 2        # downsample factor of the coarse search in pyramid mode
+PYRAMID_COARSE_THRESH = 0.6   # min coarse score for a location to be confirmed at full resolution
+PYRAMID_CANDIDATES = 8    # max number of coarse peaks confirmed per template
+PYRAMID_PAD = 4           # padding (in full resolution pixels) around a coarse peak when confirming
+NMS_IOU = 0.3             # in multi mode, boxes overlapping a better box of the same provider by more than this are dropped
+SCALE_LADDER = [1.0, 0.9, 1.1, 0.8, 1.2, 0.7, 1.35, 1.5]   # template scales of the scale prior search, most likely first
+SCALE_PRIOR_TOLERANCE = 0.15   # templates are tried at the ladder scales within this fraction of the page's logo height
+SCALE_PROBE_PROVIDERS = ['google', 'facebook', 'apple']   # providers whose first template ranks the ladder scales of a page without bank matches
+SCALE_PROBE_THRESH = 0.9  # min coarse score of a probed ladder scale
+SCALE_PROBE_CONFIRM = 2   # at most this many of the best probed ladder scales are matched at full resolution
+TILE_ROWS = 1080          # rows per strip in tiled mode, one 1080p viewport
+ROI_PAD = 150             # padding (in pixels) added around each region of interest
+TEMPLATE_BANK_FILE = 'templatebank.npz'   # precompiled grayscale + scaled templates, stored in the template dir
+PREFILTER_MIN_PIXELS = 50 # screenshots with fewer brand colored pixels (at half resolution) are skipped by the prefilter
+PREFILTER_HUES = [(0, 8), (170, 180), (15, 32), (55, 75), (98, 114), (125, 140)]   # red, orange/yellow, green, blue, purple in opencv hue units
 
 class TemplateMatchResult(object):
 
@@ -26,12 +55,123 @@ class TemplateMatchResult(object):
         self.match_x = match_x
         self.match_y = match_y
 
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        return cls(d['confidence'], d['oauth_provider'], d['template_img_name'], d['template_width'], d['template_height'], d['match_x'], d['match_y'])
+
 class TemplateMatcher(object):
 
-    def __init__(self, template_dir: str):
+    def __init__(self, template_dir: str, bank_file=True, pyramid=False, result_cache: ResultCache = None, threads=1, fft=False, order_file=None, prefilter_min_pixels=None, tile_rows=None, multi=False, scale_prior=False):
         self.debug = False
+        self.instrument = False   # match_files() collects a MatchStats for every screenshot
+        self.template_dir = template_dir
+        self.result_cache = result_cache
+
+        # threads > 1 matches the oauth providers of one screenshot concurrently.
+        # cv2.matchTemplate releases the GIL so this lowers single image latency.
+        self.threads = threads
+        self._executor = None
         self.logo_filenames = self.read_template_filenames(template_dir)
-        self.logo_images = self.load_and_scale_templates(self.logo_filenames)
+        self.bank_key = self.template_bank_key(self.logo_filenames)
+
+        # bank_file=True uses the default location inside template_dir, a
+        # string overrides it and None/False always rebuilds from the jpgs
+        if bank_file is True:
+            bank_file = os.path.join(template_dir, TEMPLATE_BANK_FILE)
+        self.bank_file = bank_file or None
+
+        self.logo_images = None
+        if self.bank_file:
+            self.logo_images = self.load_template_bank(self.bank_file, self.bank_key)
+
+        if self.logo_images is None:
+            self.logo_images = self.load_and_scale_templates(self.logo_filenames)
+            if self.bank_file:
+                self.save_template_bank(self.bank_file, self.bank_key, self.logo_images)
+
+        # the order file (see templateorder.py) tries the templates with the
+        # most past detections first and drops near-duplicates. it is opt-in,
+        # True uses the default location inside template_dir.
+        if order_file is True:
+            order_file = os.path.join(template_dir, TEMPLATE_ORDER_FILE)
+        self.template_order = load_template_order(order_file) if order_file else None
+        if self.template_order:
+            self.LOG_DEBUG("Using template order %s" % order_file)
+            self.logo_images = apply_template_order(self.logo_images, self.template_order)
+
+        # downsampled copies of the templates for the coarse pyramid search
+        self.pyramid = pyramid
+        self.pyramid_images = self.downsample_templates(self.logo_images) if pyramid else None
+
+        # scale_prior=True estimates the logo height of every page once and
+        # tries the missing providers at the ladder scales near it. the
+        # estimate is the best bank match. only if the bank finds nothing,
+        # the first template of the SCALE_PROBE_PROVIDERS is probed at every
+        # SCALE_LADDER scale on the downsampled screenshot, and only the
+        # SCALE_PROBE_CONFIRM scales with the best coarse peaks are matched
+        # at full resolution. see match()
+        if scale_prior and multi:
+            raise ValueError("scale prior and multi matching can't be combined")
+        self.scale_prior = scale_prior
+        self.ladder_images = self.scale_ladder_templates(self.logo_images) if scale_prior else None
+        self.probe_images = self.scale_probe_templates(self.ladder_images) if scale_prior else None
+        if scale_prior and pyramid:
+            self.pyramid_images.update(self.downsample_templates(dict((oauth_provider, [(image_name, template_image) for (_, scaled) in ladder for (_, image_name, template_image) in scaled]) for oauth_provider, ladder in self.ladder_images.items())))
+
+        # fft=True correlates the whole bank against one transform of the
+        # screenshot instead of calling cv2.matchTemplate for every template
+        if fft and pyramid:
+            raise ValueError("fft and pyramid matching can't be combined")
+        self.fft = fft
+        self.fft_correlator = FFTCorrelator(*fft_cache_budget()) if fft else None
+
+        # prefilter_min_pixels skips the template sweep for color screenshots
+        # with fewer brand colored pixels than this, see brand_color_pixels()
+        self.prefilter_min_pixels = prefilter_min_pixels
+        self.prefiltered = 0
+        self._prefiltered_lock = threading.Lock()   # the service matches on several threads
+
+        # tile_rows matches tall (full page) screenshots in overlapping
+        # horizontal strips, so the correlation maps are at most one strip
+        # big instead of the whole page. the strips overlap by the height of
+        # the largest template (ladder scales included) so every template
+        # position is in one strip.
+        self.tile_rows = tile_rows
+
+        # multi=True returns every location of every provider instead of the
+        # first template that matches, see __match_all()
+        self.multi = multi
+        self.tile_overlap = max(template_image.shape[0] for (_, template_image) in self.all_templates()) - 1
+        self._buffers = threading.local()
+
+    def all_templates(self) -> list[tuple[str, cv2.Mat]]:
+        # (name, image) of every template match() can try: the bank and,
+        # with the scale prior, every ladder scale
+        templates = [(image_name, template_image) for image_list in self.logo_images.values() for (image_name, template_image) in image_list]
+        if self.ladder_images:
+            templates.extend((image_name, template_image) for ladder in self.ladder_images.values() for (_, scaled) in ladder for (_, image_name, template_image) in scaled)
+        return templates
+
+    def __getstate__(self):
+        # thread pools can't be pickled, worker processes start their own
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        del state['_buffers']
+        del state['_prefiltered_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffers = threading.local()
+        self._prefiltered_lock = threading.Lock()
+
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads)
+        return self._executor
 
     def read_template_filenames(self, dir: str) -> dict[str, (str, str)]:
         template_images = {}
@@ -68,14 +208,269 @@ class TemplateMatcher(object):
 
         return logo_images
 
+    def downsample_templates(self, logo_images: dict[str, list], factor=PYRAMID_FACTOR) -> dict[str, cv2.Mat]:
+        # template name -> downsampled template
+        pyramid_images = {}
+        for oauth_provider, image_list in logo_images.items():
+            for (image_name, template_image) in image_list:
+                pyramid_images[image_name] = cv2.resize(template_image, (0,0), fx=1.0/factor, fy=1.0/factor, interpolation=cv2.INTER_AREA)
+        return pyramid_images
+
+    def scale_ladder_templates(self, logo_images: dict[str, list], scales=None) -> dict[str, list]:
+        # every original (unscaled) template at every ladder scale the bank
+        # doesn't cover: oauth_provider -> [(basename, [(scale, name@scale, image), ...]), ...]
+        scales = scales or self.ladder_scales()
+        basenames = set(basename for (basename, _) in self.logo_filenames.values())
+        ladder_images = {}
+        for oauth_provider, image_list in logo_images.items():
+            ladder_images[oauth_provider] = []
+            for (image_name, template_image) in image_list:
+                if image_name not in basenames:
+                    continue
+                scaled = [(scale, '%s@%.2f' % (image_name, scale), template_image if scale == 1.0 else cv2.resize(template_image, (0,0), fx=scale, fy=scale)) for scale in scales]
+                ladder_images[oauth_provider].append((image_name, scaled))
+        return ladder_images
+
+    def scale_probe_templates(self, ladder_images: dict[str, list], providers=SCALE_PROBE_PROVIDERS, factor=PYRAMID_FACTOR) -> dict[float, list]:
+        # the first template of the probe providers at every ladder scale,
+        # with its downsampled copy for the coarse probe:
+        # scale -> [(oauth_provider, name@scale, image, small image), ...]
+        probe_images = defaultdict(list)
+        for oauth_provider, ladder in ladder_images.items():
+            if oauth_provider not in providers or not ladder:
+                continue
+            for (scale, image_name, template_image) in ladder[0][1]:
+                small_template_image = cv2.resize(template_image, (0,0), fx=1.0/factor, fy=1.0/factor, interpolation=cv2.INTER_AREA)
+                probe_images[scale].append((oauth_provider, image_name, template_image, small_template_image))
+        return probe_images
+
+    def template_bank_key(self, template_images: dict[str, (str,str)], scale_factor=SCALE_FACTOR, scale_versions=SCALE_VERSIONS) -> str:
+        # the key changes whenever a template is added, removed or edited, or
+        # when the scaling parameters change. only the raw bytes are hashed,
+        # nothing is decoded.
+        h = hashlib.sha1()
+        h.update(('%f,%d' % (scale_factor, scale_versions)).encode())
+        for logo_file, (basename, oauth_provider) in template_images.items():
+            h.update(basename.encode())
+            with open(logo_file, 'rb') as f:
+                h.update(f.read())
+        return h.hexdigest()
+
+    def load_template_bank(self, bank_file: str, bank_key: str):
+        # returns None if the bank is missing, unreadable or stale
+        try:
+            with np.load(bank_file, allow_pickle=False) as bank:
+                if str(bank['key']) != bank_key:
+                    self.LOG_DEBUG("Template bank %s is stale" % bank_file)
+                    return None
+
+                pixels = bank['pixels']
+                logo_images = defaultdict(list)
+                for oauth_provider, image_name, offset, (rows, cols) in zip(bank['providers'], bank['names'], bank['offsets'], bank['shapes']):
+                    template_image = pixels[offset:offset + rows * cols].reshape(rows, cols)
+                    logo_images[str(oauth_provider)].append((str(image_name), template_image))
+        except (OSError, KeyError, ValueError) as e:
+            self.LOG_DEBUG("Could not load template bank %s: %s" % (bank_file, e))
+            return None
+
+        self.LOG_DEBUG("Loaded template bank %s" % bank_file)
+        return logo_images
+
+    def save_template_bank(self, bank_file: str, bank_key: str, logo_images: dict[str, list]):
+        # all templates are stored in one flat buffer, so loading the bank is
+        # a handful of reads and each template is a view into that buffer
+        providers = []
+        names = []
+        shapes = []
+        offsets = []
+        pixels = []
+        offset = 0
+        for oauth_provider, image_list in logo_images.items():
+            for (image_name, template_image) in image_list:
+                providers.append(oauth_provider)
+                names.append(image_name)
+                shapes.append(template_image.shape[:2])
+                offsets.append(offset)
+                pixels.append(template_image.ravel())
+                offset += template_image.size
+
+        # write to a temporary file first so that concurrent runs never
+        # see a half written bank
+        tmp_file = '%s.%d.tmp' % (bank_file, os.getpid())
+        try:
+            with open(tmp_file, 'wb') as f:
+                np.savez(f, key=np.array(bank_key), providers=np.array(providers), names=np.array(names),
+                         shapes=np.array(shapes, dtype=np.int64), offsets=np.array(offsets, dtype=np.int64), pixels=np.concatenate(pixels))
+            os.replace(tmp_file, bank_file)
+        except OSError as e:
+            # e.g. a read-only template dir, we can still run without the bank
+            self.LOG_DEBUG("Could not save template bank %s: %s" % (bank_file, e))
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
     def LOG_DEBUG(self, str):
         if self.debug:
             sys.stderr.write(str + '\n')
 
-    def matchfile(self, website_img_filename: str) -> list[TemplateMatchResult]:
-        image_o = cv2.imread(website_img_filename)
-        image = cv2.cvtColor(image_o, cv2.COLOR_BGR2GRAY)
-        return self.match(image)
+    def matchfile(self, website_img_filename: str, rois=None, stats: MatchStats = None) -> list[TemplateMatchResult]:
+        # stats, if given, collects the timers and counters of this screenshot
+        stats = stats or NO_STATS
+        if self.result_cache is None:
+            with stats.stage('decode'):
+                image = imread_color(website_img_filename)
+            # rebinding image frees the color buffer before the sweep
+            image = self.prefilter_grayscale(image, stats)
+            return [] if image is None else self.match(image, rois, stats)
+
+        # hash the raw file first, on a hit we never decode the png
+        with stats.stage('read'):
+            with open(website_img_filename, 'rb') as f:
+                image_data = f.read()
+
+        return self.matchbytes(image_data, rois, stats)
+
+    def matchbytes(self, image_data: bytes, rois=None, stats: MatchStats = None) -> list[TemplateMatchResult]:
+        # like matchfile, for an encoded (png) screenshot that is already in memory
+        stats = stats or NO_STATS
+        if self.result_cache is None:
+            with stats.stage('decode'):
+                image = imdecode(image_data)
+            image = self.prefilter_grayscale(image, stats)
+            return [] if image is None else self.match(image, rois, stats)
+
+        with stats.stage('cache'):
+            image_hash = self.result_cache.image_hash(image_data)
+            params = self.match_params(rois)
+            cached = self.result_cache.get(image_hash, params)
+
+        if cached is not None:
+            self.LOG_DEBUG("%s: cached result" % image_hash)
+            stats.count('cache_hits')
+            matches, prefiltered = cached
+            if prefiltered:
+                # skipped by the prefilter when it was cached, still counted as skipped
+                self.count_prefiltered()
+                stats.count('prefiltered')
+            return [TemplateMatchResult.from_dict(d) for d in matches]
+        stats.count('cache_misses')
+
+        with stats.stage('decode'):
+            image = imdecode(image_data)
+        image = self.prefilter_grayscale(image, stats)
+        prefiltered = image is None
+        matches = [] if prefiltered else self.match(image, rois, stats)
+
+        with stats.stage('cache'):
+            self.result_cache.put(image_hash, params, [m.to_dict() for m in matches], prefiltered)
+        return matches
+
+    def prefilter_grayscale(self, image: cv2.Mat, stats: MatchStats = None):
+        # the grayscale screenshot to match, or None if the prefilter skips
+        # it. image is decoded with cv2.IMREAD_COLOR, the prefilter needs the
+        # colors before they are thrown away. callers rebind their image to
+        # the result, so the color buffer isn't kept alive during match()
+        stats = stats or NO_STATS
+        if self.prefilter(image, stats):
+            return None
+        with stats.stage('grayscale'):
+            return to_grayscale(image)
+
+    def count_prefiltered(self):
+        with self._prefiltered_lock:
+            self.prefiltered += 1
+
+    def prefilter(self, image: cv2.Mat, stats: MatchStats = None) -> bool:
+        # True if the prefilter skips this screenshot (decoded with
+        # cv2.IMREAD_COLOR), which is counted in self.prefiltered
+        stats = stats or NO_STATS
+        if not self.prefilter_min_pixels:
+            return False
+
+        with stats.stage('prefilter'):
+            brand_pixels = brand_color_pixels(image)
+        if brand_pixels is not None and brand_pixels < self.prefilter_min_pixels:
+            self.LOG_DEBUG("prefilter: only %d brand colored pixels, skipped" % brand_pixels)
+            self.count_prefiltered()
+            stats.count('prefiltered')
+            return True
+        return False
+
+    def match_params(self, rois=None) -> str:
+        # everything besides the screenshot itself that changes the result of
+        # match(), used as part of the result cache key
+        params = {
+            'bank': self.bank_key,
+            'thresh': MATCH_THRESH,
+            'pyramid': [PYRAMID_FACTOR, PYRAMID_COARSE_THRESH, PYRAMID_CANDIDATES, PYRAMID_PAD] if self.pyramid else None,
+            'fft': self.fft,
+            'prefilter': [self.prefilter_min_pixels, PREFILTER_HUES] if self.prefilter_min_pixels else None,
+            'order': hashlib.sha1(json.dumps(self.template_order, sort_keys=True).encode()).hexdigest() if self.template_order else None,
+            'rois': [ROI_PAD, [list(roi) for roi in rois]] if rois else None,
+            'tile_rows': self.tile_rows,
+            'multi': NMS_IOU if self.multi else None,
+            'scale_prior': [SCALE_LADDER, SCALE_PRIOR_TOLERANCE, SCALE_PROBE_PROVIDERS, SCALE_PROBE_THRESH, SCALE_PROBE_CONFIRM] if self.scale_prior else None,
+        }
+        return json.dumps(params, sort_keys=True)
+
+    def roi_regions(self, website_img: cv2.Mat, rois) -> list[tuple[int, int, cv2.Mat]]:
+        # turns (x, y, width, height) boxes into padded, merged crops of the
+        # screenshot. without any usable box the whole screenshot is searched.
+        img_rows, img_cols = website_img.shape[:2]
+
+        boxes = []
+        for (x, y, w, h) in rois or []:
+            x0, y0 = max(0, int(x) - ROI_PAD), max(0, int(y) - ROI_PAD)
+            x1, y1 = min(img_cols, int(x + w) + ROI_PAD), min(img_rows, int(y + h) + ROI_PAD)
+            if x1 > x0 and y1 > y0:
+                boxes.append([x0, y0, x1, y1])
+
+        # merge overlapping boxes so no pixel is searched twice
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    a, b = boxes[i], boxes[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del boxes[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        if not boxes:
+            return [(0, 0, website_img)]
+
+        self.LOG_DEBUG('searching %d regions: %s' % (len(boxes), boxes))
+        return [(x0, y0, website_img[y0:y1, x0:x1]) for (x0, y0, x1, y1) in boxes]
+
+    def tile_regions(self, regions: list[tuple[int, int, cv2.Mat]]) -> list[tuple[int, int, cv2.Mat]]:
+        # splits every region taller than tile_rows into overlapping strips
+        if not self.tile_rows:
+            return regions
+
+        tiles = []
+        for (region_x, region_y, region_img) in regions:
+            rows = region_img.shape[0]
+            for y0 in range(0, max(1, rows - self.tile_overlap), self.tile_rows):
+                tiles.append((region_x, region_y + y0, region_img[y0:y0 + self.tile_rows + self.tile_overlap]))
+        return tiles
+
+    def result_buffer(self, rows: int, cols: int) -> np.ndarray:
+        # a correlation map buffer per thread that is reused for every
+        # template and strip, instead of allocating a new map every time
+        buffer = getattr(self._buffers, 'result', None)
+        if buffer is None or buffer.shape[0] < rows or buffer.shape[1] < cols:
+            buffer = np.empty((max(rows, self.tile_rows + self.tile_overlap), cols), np.float32)
+            self._buffers.result = buffer
+        return buffer[:rows, :cols]
+
+    def correlate(self, website_img: cv2.Mat, template_image: cv2.Mat) -> np.ndarray:
+        if self.tile_rows:
+            result = self.result_buffer(website_img.shape[0] - template_image.shape[0] + 1, website_img.shape[1] - template_image.shape[1] + 1)
+            return cv2.matchTemplate(website_img, template_image, cv2.TM_CCOEFF_NORMED, result=result)
+        return cv2.matchTemplate(website_img, template_image, cv2.TM_CCOEFF_NORMED)
 
     def __match_original(self, website_img: cv2.Mat, template_image: cv2.Mat, image_name: str, oauth_provider: str):
         # from manual testing, cv2.TM_SQDIFF_NORMED detection works much better than others. 
@@ -102,14 +497,14 @@ class TemplateMatcher(object):
 
     def __match_new(self, website_img: cv2.Mat, template_image: cv2.Mat, image_name: str, oauth_provider: str):
 
-        res = cv2.matchTemplate(website_img, template_image, cv2.TM_CCOEFF_NORMED)
+        res = self.correlate(website_img, template_image)
 
         _, max_val, _, max_loc = cv2.minMaxLoc(res)
 
         self.LOG_DEBUG('%s %s %s' % (oauth_provider, image_name, max_val))
 
-        if max_val >= 0.92:
-            template_width, template_height = template_image.shape[:2]
+        if max_val >= MATCH_THRESH:
+            template_height, template_width = template_image.shape[:2]
             MPx, MPy = max_loc
             return TemplateMatchResult(max_val, oauth_provider, image_name, template_width, template_height, MPx, MPy)
         else:
@@ -129,17 +524,487 @@ class TemplateMatcher(object):
         
         return None
 
-    def match(self, website_img: cv2.Mat) -> list[TemplateMatchResult]:
+    def __match_fft(self, website_spectrum, template_image: cv2.Mat, image_name: str, oauth_provider: str):
+        res = self.fft_correlator.correlate(website_spectrum, template_image, oauth_provider + '/' + image_name)
 
-        matches = []
-        for oauth_provider, image_list in self.logo_images.items():
-            for (image_name, template_image) in image_list:
-                match_result = self.__match_new(website_img, template_image, image_name, oauth_provider)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+
+        self.LOG_DEBUG('%s %s %s' % (oauth_provider, image_name, max_val))
+
+        if max_val >= MATCH_THRESH:
+            template_height, template_width = template_image.shape[:2]
+            MPx, MPy = max_loc
+            return TemplateMatchResult(max_val, oauth_provider, image_name, template_width, template_height, MPx, MPy)
+        else:
+            return None
+
+    def __match_pyramid(self, website_img: cv2.Mat, small_website_img: cv2.Mat, template_image: cv2.Mat, small_template_image: cv2.Mat, image_name: str, oauth_provider: str, multi=False):
+        # coarse to fine: find candidate locations on the downsampled screenshot,
+        # then only run the full resolution match in a small window around
+        # each candidate. a detection still needs a full resolution score of
+        # MATCH_THRESH, so this never accepts anything the exhaustive search wouldn't.
+        # multi=True returns a list of every confirmed candidate instead of the first.
+        confirmed = []
+        coarse = cv2.matchTemplate(small_website_img, small_template_image, cv2.TM_CCOEFF_NORMED)
+
+        trows, tcols = template_image.shape[:2]
+        srows, scols = small_template_image.shape[:2]
+        img_rows, img_cols = website_img.shape[:2]
+
+        for _ in range(PYRAMID_CANDIDATES):
+            _, coarse_val, _, (cx, cy) = cv2.minMaxLoc(coarse)
+            if coarse_val < PYRAMID_COARSE_THRESH:
+                break
+
+            # confirm at full resolution
+            x0 = max(0, cx * PYRAMID_FACTOR - PYRAMID_PAD)
+            y0 = max(0, cy * PYRAMID_FACTOR - PYRAMID_PAD)
+            x1 = min(img_cols, cx * PYRAMID_FACTOR + tcols + PYRAMID_FACTOR + PYRAMID_PAD)
+            y1 = min(img_rows, cy * PYRAMID_FACTOR + trows + PYRAMID_FACTOR + PYRAMID_PAD)
+
+            res = cv2.matchTemplate(website_img[y0:y1, x0:x1], template_image, cv2.TM_CCOEFF_NORMED)
+            _, max_val, _, (mx, my) = cv2.minMaxLoc(res)
+
+            self.LOG_DEBUG('%s %s coarse %s fine %s' % (oauth_provider, image_name, coarse_val, max_val))
+
+            if max_val >= MATCH_THRESH:
+                template_height, template_width = template_image.shape[:2]
+                match_result = TemplateMatchResult(max_val, oauth_provider, image_name, template_width, template_height, x0 + mx, y0 + my)
+                if not multi:
+                    return match_result
+                confirmed.append(match_result)
+
+            # suppress this peak and try the next best one
+            coarse[max(0, cy - srows // 2):cy + srows // 2 + 1, max(0, cx - scols // 2):cx + scols // 2 + 1] = -1.0
+
+        return confirmed if multi else None
+
+    def match(self, website_img: cv2.Mat, rois=None, stats: MatchStats = None) -> list[TemplateMatchResult]:
+        stats = stats or NO_STATS
+
+        with stats.stage('prepare'):
+            regions = self.tile_regions(self.roi_regions(website_img, rois))
+
+            if self.pyramid:
+                small_regions = [cv2.resize(region_img, (0,0), fx=1.0/PYRAMID_FACTOR, fy=1.0/PYRAMID_FACTOR, interpolation=cv2.INTER_AREA) for (_, _, region_img) in regions]
+            else:
+                small_regions = None
+
+            if self.fft:
+                # transform every region once for all templates
+                region_spectra = [self.fft_correlator.prepare(region_img) for (_, _, region_img) in regions]
+            else:
+                region_spectra = None
+
+        with stats.stage('match'):
+            results = self.__match_providers(list(self.logo_images.items()), regions, small_regions, region_spectra, stats)
+
+            if self.scale_prior:
+                provider_results = dict(zip(self.logo_images, results))
+                self.__match_scale_prior(provider_results, regions, small_regions, region_spectra, stats)
+                results = [provider_results[oauth_provider] for oauth_provider in self.logo_images]
+
+        if self.multi:
+            return [match_result for provider_results in results for match_result in provider_results]
+        return [match_result for match_result in results if match_result]
+
+    def __match_providers(self, provider_lists: list, regions: list, small_regions: list, region_spectra: list, stats: MatchStats) -> list:
+        # the result of every (oauth_provider, image_list), in order
+        if self.threads > 1:
+            return list(self.executor().map(lambda item: self.__match_provider(item[0], item[1], regions, small_regions, region_spectra, stats), provider_lists))
+        return [self.__match_provider(oauth_provider, image_list, regions, small_regions, region_spectra, stats) for oauth_provider, image_list in provider_lists]
+
+    def __match_scale_prior(self, provider_results: dict, regions: list, small_regions: list, region_spectra: list, stats: MatchStats):
+        # adds the providers found at the ladder scales to provider_results,
+        # which has the bank results of the page
+        confirmed = [match_result for match_result in provider_results.values() if match_result]
+
+        if not confirmed:
+            # nothing at the bank scales: the ladder scales are ranked by a
+            # coarse probe of a few providers and only the best ones are tried
+            # at full resolution (until one confirms), instead of every
+            # provider at every scale
+            for scale in self.__probe_scales(regions, small_regions, stats)[:SCALE_PROBE_CONFIRM]:
+                probes = [(oauth_provider, [(image_name, template_image)]) for (oauth_provider, image_name, template_image, _) in self.probe_images[scale]]
+                stats.count('scale_probes_confirmed')
+                confirmed = [(oauth_provider, match_result) for (oauth_provider, _), match_result in zip(probes, self.__match_providers(probes, regions, small_regions, region_spectra, stats)) if match_result]
+                if confirmed:
+                    self.LOG_DEBUG('scale prior: probe confirmed at %.2f' % scale)
+                    provider_results.update(confirmed)
+                    confirmed = [match_result for (_, match_result) in confirmed]
+                    break
+
+        if not confirmed:
+            return
+
+        logo_height = max(confirmed, key=lambda match_result: match_result.confidence).template_height
+        self.LOG_DEBUG('scale prior: logo height %d' % logo_height)
+        provider_lists = [(oauth_provider, self.scale_prior_templates(oauth_provider, logo_height)) for oauth_provider in self.logo_images if not provider_results.get(oauth_provider)]
+        provider_lists = [(oauth_provider, image_list) for oauth_provider, image_list in provider_lists if image_list]
+        provider_results.update(zip([oauth_provider for oauth_provider, _ in provider_lists], self.__match_providers(provider_lists, regions, small_regions, region_spectra, stats)))
+
+    def __probe_scales(self, regions: list, small_regions: list, stats: MatchStats) -> list[float]:
+        # the ladder scales whose probe templates have a coarse peak of at
+        # least SCALE_PROBE_THRESH on the downsampled regions, best peak
+        # first. at a quarter of the pixels, all scales together cost less
+        # than 5 full resolution templates
+        if small_regions is None:
+            small_regions = [cv2.resize(region_img, (0,0), fx=1.0/PYRAMID_FACTOR, fy=1.0/PYRAMID_FACTOR, interpolation=cv2.INTER_AREA) for (_, _, region_img) in regions]
+
+        peaks = {}
+        for scale in self.ladder_scales():
+            for (oauth_provider, image_name, _, small_template_image) in self.probe_images[scale]:
+                stats.count('scale_probes')
+                for small_region in small_regions:
+                    if small_region.shape[0] < small_template_image.shape[0] or small_region.shape[1] < small_template_image.shape[1]:
+                        continue
+                    coarse_val = cv2.minMaxLoc(cv2.matchTemplate(small_region, small_template_image, cv2.TM_CCOEFF_NORMED))[1]
+                    if coarse_val >= max(SCALE_PROBE_THRESH, peaks.get(scale, -1.0)):
+                        peaks[scale] = coarse_val
+
+        self.LOG_DEBUG('scale prior: coarse probe peaks %s' % peaks)
+        return sorted(peaks, key=lambda scale: -peaks[scale])
+
+    def ladder_scales(self, scales=SCALE_LADDER, scale_factor=SCALE_FACTOR, scale_versions=SCALE_VERSIONS) -> list[float]:
+        # the ladder scales the bank doesn't cover, most likely first
+        min_bank_scale = 1.0 - scale_factor * (scale_versions - 1)
+        return [scale for scale in scales if not min_bank_scale <= scale <= 1.0]
+
+    def scale_prior_templates(self, oauth_provider: str, logo_height: int) -> list:
+        # the ladder scales outside of the bank's scales that make a template
+        # within SCALE_PRIOR_TOLERANCE of the logo height
+        scales = self.ladder_scales()
+        image_list = []
+        for basename, scaled in self.ladder_images[oauth_provider]:
+            image_list.extend((image_name, template_image) for (scale, image_name, template_image) in scaled
+                              if scale in scales and abs(template_image.shape[0] - logo_height) <= SCALE_PRIOR_TOLERANCE * logo_height)
+        return image_list
+
+    def __match_provider(self, oauth_provider: str, image_list: list, regions: list, small_regions: list, region_spectra: list, stats: MatchStats = NO_STATS):
+        # returns the first template of this oauth provider found in any region
+        if stats is not NO_STATS:
+            start = time.perf_counter()
+            match_result = self.__match_templates(oauth_provider, image_list, regions, small_regions, region_spectra, stats)
+            stats.add_time(stats.providers, oauth_provider, time.perf_counter() - start)
+            return match_result
+        return self.__match_templates(oauth_provider, image_list, regions, small_regions, region_spectra, stats)
+
+    def __match_templates(self, oauth_provider: str, image_list: list, regions: list, small_regions: list, region_spectra: list, stats: MatchStats):
+        if self.multi:
+            return self.__match_all(oauth_provider, image_list, regions, small_regions, region_spectra, stats)
+
+        for i, (image_name, template_image) in enumerate(image_list):
+            match_result = None
+            if stats is not NO_STATS:
+                start = time.perf_counter()
+                stats.count('templates_tried')
+
+            for r, (region_x, region_y, region_img) in enumerate(regions):
+                # the region has to be at least as big as the template
+                if region_img.shape[0] < template_image.shape[0] or region_img.shape[1] < template_image.shape[1]:
+                    continue
+
+                if self.pyramid:
+                    small_template_image = self.pyramid_images[image_name]
+                    if small_regions[r].shape[0] < small_template_image.shape[0] or small_regions[r].shape[1] < small_template_image.shape[1]:
+                        continue
+                    region_result = self.__match_pyramid(region_img, small_regions[r], template_image, small_template_image, image_name, oauth_provider)
+                elif self.fft:
+                    region_result = self.__match_fft(region_spectra[r], template_image, image_name, oauth_provider)
+                else:
+                    region_result = self.__match_new(region_img, template_image, image_name, oauth_provider)
+
+                # keep the best score of all regions (or strips), the same
+                # location a search of the whole screenshot would report
+                if region_result and (match_result is None or region_result.confidence > match_result.confidence):
+                    region_result.match_x += region_x
+                    region_result.match_y += region_y
+                    match_result = region_result
+
+            if stats is not NO_STATS:
+                stats.add_time(stats.templates, image_name, time.perf_counter() - start)
                 if match_result:
-                    matches.append(match_result)
-                    break # finish this oauth provider
+                    stats.count('early_exits')
+                    stats.count('templates_skipped', len(image_list) - i - 1)
 
-        return matches
+            if match_result:
+                return match_result # finish this oauth provider
+
+        return None
+
+    def __match_all(self, oauth_provider: str, image_list: list, regions: list, small_regions: list, region_spectra: list, stats: MatchStats) -> list[TemplateMatchResult]:
+        # multi mode: every peak over MATCH_THRESH of every template and
+        # region. the same button is found by several templates and scales
+        # (and by two strips where they overlap), non-maximum suppression
+        # keeps the best box of each.
+        candidates = []
+        for i, (image_name, template_image) in enumerate(image_list):
+            if stats is not NO_STATS:
+                start = time.perf_counter()
+                stats.count('templates_tried')
+
+            template_height, template_width = template_image.shape[:2]
+            for r, (region_x, region_y, region_img) in enumerate(regions):
+                if region_img.shape[0] < template_height or region_img.shape[1] < template_width:
+                    continue
+
+                if self.pyramid:
+                    small_template_image = self.pyramid_images[image_name]
+                    if small_regions[r].shape[0] < small_template_image.shape[0] or small_regions[r].shape[1] < small_template_image.shape[1]:
+                        continue
+                    for match_result in self.__match_pyramid(region_img, small_regions[r], template_image, small_template_image, image_name, oauth_provider, multi=True):
+                        match_result.match_x += region_x
+                        match_result.match_y += region_y
+                        candidates.append(match_result)
+                    continue
+
+                if self.fft:
+                    res = self.fft_correlator.correlate(region_spectra[r], template_image, oauth_provider + '/' + image_name)
+                else:
+                    res = self.correlate(region_img, template_image)
+
+                for (x, y, score) in find_peaks(res, MATCH_THRESH):
+                    candidates.append(TemplateMatchResult(score, oauth_provider, image_name, template_width, template_height, region_x + x, region_y + y))
+
+            if stats is not NO_STATS:
+                stats.add_time(stats.templates, image_name, time.perf_counter() - start)
+
+        keep = nms([(m.match_x, m.match_y, m.template_width, m.template_height) for m in candidates], [m.confidence for m in candidates])
+        self.LOG_DEBUG('%s: %d peaks, %d after nms' % (oauth_provider, len(candidates), len(keep)))
+        return [candidates[k] for k in keep]
+
+def find_peaks(res: np.ndarray, thresh: float) -> list[tuple[int, int, float]]:
+    # (x, y, score) of the local maxima of a correlation map that score at
+    # least thresh. most maps have none, minMaxLoc rules those out cheaply.
+    if cv2.minMaxLoc(res)[1] < thresh:
+        return []
+
+    local_max = res == cv2.dilate(res, np.ones((3, 3), np.uint8))
+    ys, xs = np.nonzero(local_max & (res >= thresh))
+    return list(zip(xs.tolist(), ys.tolist(), res[ys, xs].tolist()))
+
+def nms(boxes: list[tuple[int, int, int, int]], scores: list[float], iou_thresh=NMS_IOU) -> list[int]:
+    # greedy non-maximum suppression of (x, y, width, height) boxes, returns
+    # the indices of the kept boxes, best first
+    if not boxes:
+        return []
+
+    boxes = np.array(boxes, dtype=np.float64)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+
+    order = np.argsort(-np.array(scores), kind='stable')
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(int(best))
+
+        overlap_w = np.maximum(0, np.minimum(x1[best], x1[rest]) - np.maximum(x0[best], x0[rest]))
+        overlap_h = np.maximum(0, np.minimum(y1[best], y1[rest]) - np.maximum(y0[best], y0[rest]))
+        overlap = overlap_w * overlap_h
+        iou = overlap / (areas[best] + areas[rest] - overlap)
+        order = rest[iou <= iou_thresh]
+
+    return keep
+
+def to_grayscale(image: cv2.Mat) -> cv2.Mat:
+    # converts a screenshot decoded with cv2.IMREAD_COLOR to 8 bit grayscale,
+    # the same cv2.COLOR_BGR2GRAY the templates are converted with.
+    #
+    # cv2.IMREAD_COLOR is used rather than cv2.IMREAD_UNCHANGED because
+    # libpng strips the alpha channel of the RGBA screenshots while
+    # decoding, so the decode buffer has 3 channels instead of 4.
+    # cv2.IMREAD_GRAYSCALE is not used on purpose: libpng's gray conversion
+    # is gamma aware and gives different pixels (up to 64 levels off on
+    # test-data), which changes detections.
+    if image is None:
+        raise ValueError("could not decode image")
+
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+def imread_color(website_img_filename: str) -> cv2.Mat:
+    image = cv2.imread(website_img_filename, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("could not read image %s" % website_img_filename)
+    return image
+
+def imread_grayscale(website_img_filename: str) -> cv2.Mat:
+    return to_grayscale(imread_color(website_img_filename))
+
+def imdecode(image_data: bytes) -> cv2.Mat:
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("could not decode image")
+    return image
+
+def brand_color_pixels(image: cv2.Mat):
+    # cheap signal for the prefilter: the number of saturated pixels in the
+    # hues of the provider logos, counted on every other pixel of an image
+    # decoded with cv2.IMREAD_COLOR. every screenshot in test-data/sso
+    # has a google G or a facebook f and more than 100 of them. pages where
+    # all logos are monochrome (e.g. only apple and github) have none.
+    # returns None for grayscale screenshots, there is nothing to count.
+    if image.ndim == 2 or image.shape[2] < 3:
+        return None
+
+    small = image[::2, ::2, :3]
+    hue, sat, val = cv2.split(cv2.cvtColor(small, cv2.COLOR_BGR2HSV))
+    saturated = cv2.bitwise_and(cv2.inRange(sat, 100, 255), cv2.inRange(val, 100, 255))
+
+    count = 0
+    for lo, hi in PREFILTER_HUES:
+        count += cv2.countNonZero(cv2.bitwise_and(cv2.inRange(hue, lo, hi), saturated))
+    return count
+
+def parse_roi(roi: str) -> tuple[int, int, int, int]:
+    # "x,y,width,height"
+    x, y, w, h = [int(float(v)) for v in roi.split(',')]
+    return (x, y, w, h)
+
+def roi_filename(image_file: str) -> str:
+    # 1000-https!www.trulia.com-20230201092548677-1.png -> 1000-https!www.trulia.com-20230201092548677-1.roi.json
+    return os.path.splitext(image_file)[0] + '.roi.json'
+
+def load_roi_file(roi_file: str) -> list[tuple[int, int, int, int]]:
+    # a json list of boxes, either [x, y, width, height] or the
+    # {"x", "y", "width", "height"} objects returned by playwright's
+    # locator.boundingBox(). a missing file means no regions.
+    try:
+        with open(roi_file) as f:
+            boxes = json.load(f)
+    except (OSError, ValueError):
+        return []
+
+    rois = []
+    for box in boxes:
+        if isinstance(box, dict):
+            box = (box['x'], box['y'], box['width'], box['height'])
+        rois.append(tuple(int(v) for v in box))
+    return rois
+
+# Each worker process keeps its own TemplateMatcher so the template bank is
+# only loaded once per process instead of once per screenshot. With the fork
+# start method the matcher built by the parent is simply inherited, otherwise
+# it is pickled once per worker.
+_worker_matcher = None
+
+def _init_worker(matcher: TemplateMatcher):
+    global _worker_matcher
+    if _worker_matcher is None:
+        _worker_matcher = matcher
+
+def _match_worker(task: tuple[str, list]) -> tuple[str, list[TemplateMatchResult], str, bool, dict]:
+    return _match_task(_worker_matcher, task)
+
+def _match_task(matcher: TemplateMatcher, task: tuple[str, list]) -> tuple[str, list[TemplateMatchResult], str, bool, dict]:
+    # one broken screenshot shouldn't stop a run over thousands of them
+    image_file, rois = task
+    prefiltered = matcher.prefiltered
+    stats = MatchStats() if matcher.instrument else None
+    try:
+        with (stats or NO_STATS).stage('total'):
+            matches = matcher.matchfile(image_file, rois, stats)
+        return (image_file, matches, None, matcher.prefiltered > prefiltered, stats.to_dict() if stats else None)
+    except (OSError, ValueError, cv2.error) as e:
+        return (image_file, [], str(e), False, stats.to_dict() if stats else None)
+
+def expand_image_paths(paths: list[str], pattern='*-1.png') -> list[str]:
+    # directories are expanded to the login screenshots inside them so we
+    # don't have to pass thousands of files through argv
+    image_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            image_files.extend(sorted(glob.glob(os.path.join(path, pattern))))
+        else:
+            image_files.append(path)
+    return image_files
+
+WEBSITES_FIELDS = 18        # columns of a websites-*.csv row
+WEBSITES_LOGIN_SCREENSHOT = -13   # screenshot_login_url, before the 2 html.gz and 10 provider columns
+
+def read_image_paths(stream, image_dir=''):
+    # lazily yields screenshot paths from a stream with either one path per
+    # line or websites-*.csv rows, where the login screenshot is the
+    # screenshot_login_url column and relative to image_dir. the column is
+    # counted from the end, an unquoted comma in login_url splits it too
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+
+        fields = line.split(',')
+        if len(fields) >= WEBSITES_FIELDS:
+            if not fields[WEBSITES_LOGIN_SCREENSHOT].endswith('.png'):
+                continue   # header row
+            yield os.path.join(image_dir, fields[WEBSITES_LOGIN_SCREENSHOT])
+        else:
+            yield line
+
+def match_files(matcher: TemplateMatcher, image_files, workers=1, chunksize=16, rois=None, roi_files=False):
+    # yields (image_file, matches, error, prefiltered, stats) tuples, error
+    # is None unless the screenshot couldn't be read, prefiltered is True if
+    # the prefilter skipped it and stats is the MatchStats.to_dict() of the
+    # screenshot when matcher.instrument is set. image_files can be any iterable, e.g. a
+    # stream of paths. with more than one worker the results come back in
+    # completion order, not input order.
+    # rois restricts every screenshot to the same regions, roi_files reads
+    # the regions of each screenshot from its .roi.json file.
+    tasks = ((image_file, load_roi_file(roi_filename(image_file)) if roi_files else rois) for image_file in image_files)
+
+    if workers <= 1:
+        for task in tasks:
+            yield _match_task(matcher, task)
+        return
+
+    global _worker_matcher
+    _worker_matcher = matcher
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(matcher,)) as pool:
+        for result in pool.imap_unordered(_match_worker, tasks, chunksize=chunksize):
+            yield result
+
+def dedup_match_files(matcher: TemplateMatcher, image_files, groups: ScreenshotGroups, workers=1, chunksize=16, rois=None, batch_size=DEDUP_BATCH):
+    # match_files() that only matches the representative of every group of
+    # near-duplicate screenshots (see screenshotdedup.py). the duplicates get
+    # the matches of their representative, groups.representative tells which
+    # one. the screenshots are hashed batch_size at a time, so a stream of
+    # paths is still processed as it comes, one batch behind.
+    results = {}   # representative -> (matches, prefiltered)
+    dedup_stats = {'counters': {'deduplicated': 1}} if matcher.instrument else None
+
+    image_files = iter(image_files)
+    while True:
+        batch = list(itertools.islice(image_files, batch_size))
+        if not batch:
+            return
+
+        representatives = []
+        duplicates = []
+        for image_file in batch:
+            image_hash = hash_file(image_file)
+            if image_hash is None or groups.add(image_file, image_hash) == image_file:
+                representatives.append(image_file)   # unreadable ones are reported by the matcher
+            else:
+                duplicates.append(image_file)
+
+        for image_file, matches, error, prefiltered, stats in match_files(matcher, representatives, workers=workers, chunksize=chunksize, rois=rois):
+            if not error:
+                results[image_file] = (matches, prefiltered)
+            yield (image_file, matches, error, prefiltered, stats)
+
+        # duplicates of a screenshot the matcher failed on are matched themselves
+        rematch = []
+        for image_file in duplicates:
+            representative = groups.representative[image_file]
+            if representative in results:
+                matches, prefiltered = results[representative]
+                yield (image_file, matches, None, prefiltered, dedup_stats)
+            else:
+                rematch.append(image_file)
+        yield from match_files(matcher, rematch, workers=workers, chunksize=chunksize, rois=rois)
 
 def oauth_detected_colors():
     # lol generate this automatically
@@ -157,29 +1022,126 @@ def oauth_detected_colors():
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("webpage_paths", type=str, nargs='+', help="One or many webpage screenshots to run detection on.")
+    parser.add_argument("webpage_paths", type=str, nargs='*', help="One or many webpage screenshots to run detection on. Directories are searched for *-1.png files.")
     parser.add_argument("--template_dir", required=True, type=str, help="The directory of logo template images")
+    parser.add_argument("--bank_file", type=str, help="Precompiled template bank (.npz). Defaults to %s inside the template dir and is rebuilt when a template changes." % TEMPLATE_BANK_FILE)
+    parser.add_argument("--order_file", nargs='?', const=True, help="Try the templates in the order of this file written by templateorder.py (default: %s inside the template dir) and skip the templates it drops" % TEMPLATE_ORDER_FILE)
+    parser.add_argument("--no_bank", help="Always decode and scale the template jpgs instead of using the template bank", action="store_true")
+    parser.add_argument("--cache", nargs='?', const=RESULT_CACHE_FILE, help="Cache results by screenshot content in this sqlite file (default: %s)" % RESULT_CACHE_FILE)
     parser.add_argument("--debug", help="Increase output verbosity", action="store_true")
     parser.add_argument("--display", help="Show the detected templates. Only works is webpage_path is a single image.", action="store_true")
+    parser.add_argument("--pyramid", help="Coarse to fine search: match downsampled templates first and confirm candidates at full resolution", action="store_true")
+    parser.add_argument("--fft", help="Correlate all templates against one FFT of the screenshot instead of calling matchTemplate per template. Can't be combined with --pyramid. Each process caches template spectra (up to %dMB), it is meant for single process runs, with --workers the caches are shrunk to fit the available memory." % FFT_CACHE_MB, action="store_true")
+    parser.add_argument("--prefilter", nargs='?', type=int, const=PREFILTER_MIN_PIXELS, help="Skip screenshots with fewer than this many brand colored pixels (default: %d) without matching them" % PREFILTER_MIN_PIXELS)
+    parser.add_argument("--multi", help="Report every location of every oauth provider instead of the first template that matches. The csv output gets x,y,width,height columns.", action="store_true")
+    parser.add_argument("--scale_prior", help="Estimate the logo size of every page from its best match, or if there is none from a half resolution probe of the first %s template at %s times its size (at most %d scales confirmed at full resolution), then try the missing providers at the scales near that size. Pages without any logo take about a tenth longer" % ('/'.join(SCALE_PROBE_PROVIDERS), ', '.join(str(scale) for scale in SCALE_LADDER if not 1.0 - SCALE_FACTOR * (SCALE_VERSIONS - 1) <= scale <= 1.0), SCALE_PROBE_CONFIRM), action="store_true")
+    parser.add_argument("--tile_rows", nargs='?', type=int, const=TILE_ROWS, help="Match tall (full page) screenshots in overlapping strips of this many rows (default: %d) to bound memory" % TILE_ROWS)
+    parser.add_argument("--roi", type=parse_roi, action="append", help="Only search this x,y,width,height region (padded by %d pixels). Can be given multiple times." % ROI_PAD)
+    parser.add_argument("--roi_files", help="Only search the regions listed in the .roi.json file next to each screenshot. Screenshots without one are searched completely.", action="store_true")
+    parser.add_argument("--dedup", nargs='?', type=int, const=DEDUP_MAX_DISTANCE, help="Only match the first of every group of near-identical screenshots, whose perceptual hashes differ in at most this many bits (default: %d), and give the others its matches" % DEDUP_MAX_DISTANCE)
+    parser.add_argument("--threads", type=int, default=1, help="Number of threads matching the oauth providers of one screenshot concurrently. Useful for single images, use --workers for many.")
+    parser.add_argument("--stdin", help="Read screenshot paths (or websites-*.csv rows) line by line from stdin", action="store_true")
+    parser.add_argument("--image_dir", type=str, default='', help="Directory the screenshots of websites-*.csv rows read with --stdin are in")
+    parser.add_argument("--jsonl", help="Print one json record per screenshot, including screenshots without matches", action="store_true")
+    parser.add_argument("--manifest", type=str, help="Append every processed screenshot to this manifest file")
+    parser.add_argument("--resume", help="Skip screenshots the manifest lists as done with the same templates and settings", action="store_true")
+    parser.add_argument("--stats", type=str, help="Time the stages, oauth providers and templates and write a json summary of the run to this file")
+    parser.add_argument("--trace", type=str, help="Write the timers and counters of every screenshot to this jsonl file")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes. Each worker loads the templates once and then processes many screenshots.")
     args = parser.parse_args()
 
-    matcher = TemplateMatcher(args.template_dir)
+    if not args.webpage_paths and not args.stdin:
+        parser.error("give webpage_paths or --stdin")
+    if args.resume and not args.manifest:
+        parser.error("--resume needs a --manifest")
+    if args.fft and args.pyramid:
+        parser.error("--fft and --pyramid can't be combined")
+    if args.scale_prior and args.multi:
+        parser.error("--scale_prior and --multi can't be combined")
+    if args.dedup is not None and args.roi_files:
+        parser.error("--dedup and --roi_files can't be combined")
+
+    result_cache = ResultCache(args.cache) if args.cache else None
+    matcher = TemplateMatcher(args.template_dir, bank_file=None if args.no_bank else (args.bank_file or True), pyramid=args.pyramid, result_cache=result_cache, threads=args.threads, fft=args.fft, order_file=args.order_file, prefilter_min_pixels=args.prefilter, tile_rows=args.tile_rows, multi=args.multi, scale_prior=args.scale_prior)
     matcher.debug = args.debug
+    matcher.instrument = bool(args.stats or args.trace)
+    if args.order_file:
+        if not matcher.template_order:
+            parser.error("could not read the template order file")
+        sys.stderr.write("template order: %d templates dropped as duplicates\n" % len(matcher.template_order.get('dropped', {})))
+    if args.fft and args.workers > 1:
+        # every worker gets a copy of the correlator and its caches
+        matcher.fft_correlator = FFTCorrelator(*fft_cache_budget(args.workers))
 
     oauth_colors = oauth_detected_colors()
 
-    single_file = len(args.webpage_paths) == 1
+    if args.stdin:
+        image_files = read_image_paths(sys.stdin, args.image_dir)
+        single_file = False
+    else:
+        image_files = expand_image_paths(args.webpage_paths)
+        single_file = len(image_files) == 1
+
+    # the color screenshot is only needed to draw on. it is read before
+    # --resume turns image_files into a generator
+    if single_file and args.display:
+        webpage_image_o = cv2.imread(image_files[0])
 
-    for image_file in args.webpage_paths:
+    manifest = None
+    if args.manifest:
+        # --roi_files and --dedup change the results too. with --roi_files
+        # every record also has the size and mtime of the .roi.json
+        run_params = json.dumps({'match': matcher.match_params(args.roi), 'roi_files': args.roi_files, 'dedup': args.dedup}, sort_keys=True)
+        manifest = Manifest(args.manifest, matcher.bank_key, run_params, sidecar=roi_filename if args.roi_files else None)
+        if args.resume:
+            manifest.load()
+            image_files = list(manifest.pending(image_files)) if single_file else manifest.pending(image_files)
+            if single_file and not image_files:
+                single_file = False   # the only screenshot was already done, nothing to display
+
+    run_stats = MatchStats() if matcher.instrument else None
+    trace = open(args.trace, 'w') if args.trace else None
+
+    if args.dedup is not None:
+        groups = ScreenshotGroups(args.dedup)
+        results = dedup_match_files(matcher, image_files, groups, workers=args.workers, rois=args.roi, chunksize=1 if args.stdin else 16)
+    else:
+        groups = None
+        results = match_files(matcher, image_files, workers=args.workers, rois=args.roi, roi_files=args.roi_files, chunksize=1 if args.stdin else 16)
+
+    processed = 0
+    prefiltered = 0
+    for image_file, matches, error, skipped, stats in results:
         base_webpage_name = os.path.basename(image_file)
+        processed += 1
+        prefiltered += skipped
 
-        webpage_image_o = cv2.imread(image_file)
-        webpage_image = cv2.cvtColor(webpage_image_o, cv2.COLOR_BGR2GRAY)
+        if run_stats:
+            run_stats.merge(stats)
+        if trace:
+            trace.write(json.dumps({'path': image_file, 'stats': stats}) + '\n')
 
-        matches = matcher.match(webpage_image)
+        if error:
+            sys.stderr.write("%s: %s\n" % (image_file, error))
+
+        if args.jsonl:
+            record = {'path': image_file, 'name': base_webpage_name, 'matches': [match.to_dict() for match in matches]}
+            if error:
+                record['error'] = error
+            if skipped:
+                record['prefiltered'] = True
+            if groups and image_file in groups.representative:
+                record['duplicate_of'] = groups.representative[image_file]
+            print(json.dumps(record))
 
         for match in matches:
-            print('%s,%s,%s,%f' % (base_webpage_name, match.oauth_provider, match.template_img_name, match.confidence))
+            if args.jsonl:
+                pass
+            elif args.multi:
+                print('%s,%s,%s,%f,%d,%d,%d,%d' % (base_webpage_name, match.oauth_provider, match.template_img_name, match.confidence,
+                                                   match.match_x, match.match_y, match.template_width, match.template_height))
+            else:
+                print('%s,%s,%s,%f' % (base_webpage_name, match.oauth_provider, match.template_img_name, match.confidence))
 
             if single_file and args.display:
                 color = oauth_colors[match.oauth_provider]
@@ -187,6 +1149,29 @@ if __name__ == '__main__':
                 point2 = (match.match_x + match.template_width, match.match_y + match.template_height)
                 cv2.rectangle(webpage_image_o, point1, point2, color, thickness=2)
 
+        # results are written as they come so this can sit in a pipe
+        sys.stdout.flush()
+
+        # only record the screenshot once its results are written out
+        if manifest:
+            manifest.record(image_file, 'error' if error else 'done')
+
+    if manifest:
+        manifest.close()
+        if args.resume:
+            sys.stderr.write("resume: skipped %d screenshots already in %s\n" % (manifest.skipped, args.manifest))
+
+    if trace:
+        trace.close()
+    if args.stats:
+        with open(args.stats, 'w') as f:
+            json.dump(run_stats.summary(processed), f, indent=2)
+
+    if groups:
+        sys.stderr.write("dedup: %d of %d screenshots were near-duplicates\n" % (len(groups.representative), processed))
+    if args.prefilter:
+        sys.stderr.write("prefilter: skipped %d of %d screenshots\n" % (prefiltered, processed))
+
     if single_file and args.display:
         # Draw the OAuth Legend
         y_offset = 100
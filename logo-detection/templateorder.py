@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+import cv2
+
+TEMPLATE_ORDER_FILE = 'templateorder.json'   # default location inside the template dir
+DEDUP_THRESH = 0.98        # templates scoring at least this against each other are duplicates
+DEDUP_MAX_SIZE_DIFF = 1    # only templates within this many pixels of each other are compared
+
+# Builds the template order file the matcher reads next to the template bank:
+#
+#   {"order": {"facebook": ["facebook-2.jpg", "facebook-2.jpg_1", ...], ...},
+#    "dropped": {"facebook-15.jpg": "facebook-12.jpg", ...}}
+#
+# match() stops at the first template of a provider that matches, so every
+# provider's templates are tried most hits first, where the hits are counted
+# from the output of earlier templatematch.py runs. Templates that are
+# near-duplicates of a template with at least as many hits are dropped.
+#
+#   ./templateorder.py --template_dir templates output-templatematch-*.txt
+
+def read_hit_counts(result_files: list[str]) -> Counter:
+    # counts how often every template was the detection, from the csv lines
+    # (name,provider,template,confidence[,x,y,width,height]) or --jsonl
+    # records of past runs
+    hits = Counter()
+    for result_file in result_files:
+        with open(result_file) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('{'):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    for match in record.get('matches', []):
+                        hits[match['template_img_name']] += 1
+                else:
+                    fields = line.split(',')
+                    if len(fields) >= 4:
+                        hits[fields[2]] += 1
+    return hits
+
+def is_duplicate(template_a: cv2.Mat, template_b: cv2.Mat, thresh=DEDUP_THRESH, max_size_diff=DEDUP_MAX_SIZE_DIFF) -> bool:
+    # slides the smaller template over the larger one, the same way it would
+    # be matched against a screenshot
+    if template_a.shape[0] > template_b.shape[0] or template_a.shape[1] > template_b.shape[1]:
+        template_a, template_b = template_b, template_a
+    if template_a.shape[0] > template_b.shape[0] or template_a.shape[1] > template_b.shape[1]:
+        return False
+    if template_b.shape[0] - template_a.shape[0] > max_size_diff or template_b.shape[1] - template_a.shape[1] > max_size_diff:
+        return False
+
+    res = cv2.matchTemplate(template_b, template_a, cv2.TM_CCOEFF_NORMED)
+    return cv2.minMaxLoc(res)[1] >= thresh
+
+def build_template_order(logo_images: dict[str, list], hits: Counter, thresh=DEDUP_THRESH) -> dict:
+    order = {}
+    dropped = {}
+    for oauth_provider, image_list in logo_images.items():
+        # sorted() is stable, templates without hits keep the bank order
+        ranked = sorted(image_list, key=lambda item: -hits[item[0]])
+
+        kept = []
+        for image_name, template_image in ranked:
+            duplicate_of = None
+            if thresh is not None:
+                duplicate_of = next((kept_name for kept_name, kept_image in kept if is_duplicate(kept_image, template_image, thresh)), None)
+            if duplicate_of:
+                dropped[image_name] = duplicate_of
+            else:
+                kept.append((image_name, template_image))
+
+        order[oauth_provider] = [image_name for image_name, _ in kept]
+
+    return {'order': order, 'dropped': dropped}
+
+def load_template_order(order_file: str):
+    # returns None if there is no (readable) order file
+    try:
+        with open(order_file) as f:
+            template_order = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(template_order, dict) or 'order' not in template_order:
+        return None
+    return template_order
+
+def apply_template_order(logo_images: dict[str, list], template_order: dict) -> dict[str, list]:
+    # templates that were added after the order file was built aren't in
+    # it, they are tried last instead of being dropped
+    dropped = template_order.get('dropped', {})
+    ordered_images = {}
+    for oauth_provider, image_list in logo_images.items():
+        rank = {image_name: i for i, image_name in enumerate(template_order['order'].get(oauth_provider, []))}
+        image_list = [item for item in image_list if item[0] not in dropped]
+        ordered_images[oauth_provider] = sorted(image_list, key=lambda item: rank.get(item[0], len(rank)))
+    return ordered_images
+
+if __name__ == '__main__':
+    from templatematch import TemplateMatcher
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("result_files", type=str, nargs='*', help="Output of earlier templatematch.py runs (csv lines or --jsonl)")
+    parser.add_argument("--template_dir", required=True, type=str, help="The directory of logo template images")
+    parser.add_argument("--output", type=str, help="Where to write the order file. Defaults to %s inside the template dir." % TEMPLATE_ORDER_FILE)
+    parser.add_argument("--dedup_thresh", type=float, default=DEDUP_THRESH, help="Drop templates scoring at least this against a template with more hits")
+    parser.add_argument("--no_dedup", help="Only reorder the templates, keep all of them", action="store_true")
+    args = parser.parse_args()
+
+    matcher = TemplateMatcher(args.template_dir, order_file=None)
+    hits = read_hit_counts(args.result_files)
+    template_order = build_template_order(matcher.logo_images, hits, None if args.no_dedup else args.dedup_thresh)
+
+    output = args.output or os.path.join(args.template_dir, TEMPLATE_ORDER_FILE)
+    with open(output, 'w') as f:
+        json.dump(template_order, f, indent=2)
+
+    total = sum(len(image_list) for image_list in matcher.logo_images.values())
+    sys.stderr.write("%d templates, %d dropped as duplicates, %d detections counted\n" % (total, len(template_order['dropped']), sum(hits.values())))
+    for image_name, kept_name in sorted(template_order['dropped'].items()):
+        sys.stderr.write("  %s -> %s\n" % (image_name, kept_name))
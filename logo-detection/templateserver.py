@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from templatematch import TemplateMatcher, TEMPLATE_BANK_FILE, PREFILTER_MIN_PIXELS, TILE_ROWS
+from resultcache import ResultCache, RESULT_CACHE_FILE
+from templateorder import TEMPLATE_ORDER_FILE
+from matchstats import MatchStats
+
+# Keeps a TemplateMatcher hot and answers match requests over localhost HTTP
+# or a unix domain socket, so the crawler can get detections right after it
+# writes a screenshot instead of starting templatematch.py for every file.
+#
+#   POST /match  {"paths": ["a-1.png", "b-1.png"], "rois": [[x, y, w, h], ...]}
+#       -> {"results": [{"path": "a-1.png", "matches": [...]}, ...]}
+#   POST /match  with Content-Type: image/png and the raw png as the body
+#       -> {"results": [{"path": null, "matches": [...]}]}
+#   GET /health
+#       -> {"status": "ok", "queued": 0, "prefiltered": 0}
+#   GET /stats  (with --stats)
+#       -> the MatchStats.summary() of every screenshot matched so far
+#
+# Every screenshot is a job on a bounded work queue. When the queue stays
+# full for --queue_timeout seconds the request is rejected with 503 instead
+# of piling up in memory.
+
+class MatchService(object):
+
+    def __init__(self, matcher: TemplateMatcher, workers=1, queue_size=64, queue_timeout=30.0):
+        self.matcher = matcher
+        self.queue_timeout = queue_timeout
+        self.matched = 0
+        self.lock = threading.Lock()   # requests are handled on several threads
+        self.stats = MatchStats() if matcher.instrument else None
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.worker_threads = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        for t in self.worker_threads:
+            t.start()
+
+    def work(self):
+        while True:
+            future, fn, args = self.jobs.get()
+            if not future.set_running_or_notify_cancel():
+                self.jobs.task_done()
+                continue
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.jobs.task_done()
+
+    def submit(self, fn, *args) -> Future:
+        # waits up to queue_timeout seconds for a free slot, then raises
+        # queue.Full because the service is overloaded
+        future = Future()
+        self.jobs.put((future, fn, args), timeout=self.queue_timeout)
+        return future
+
+    def match_batch(self, paths: list[str], images: list[bytes], rois=None) -> list[dict]:
+        # queue every screenshot of the request before waiting on any of them,
+        # so one batch is spread over all workers
+        futures = []
+        try:
+            for path in paths:
+                futures.append((path, self.submit(self.matcher.matchfile, path, rois, self.stats)))
+            for image_data in images:
+                futures.append((None, self.submit(self.matcher.matchbytes, image_data, rois, self.stats)))
+        except queue.Full:
+            for _, future in futures:
+                future.cancel()
+            raise
+
+        with self.lock:
+            self.matched += len(futures)
+        results = []
+        for path, future in futures:
+            try:
+                matches = future.result()
+                results.append({'path': path, 'matches': [m.to_dict() for m in matches]})
+            except Exception as e:
+                results.append({'path': path, 'matches': [], 'error': str(e)})
+        return results
+
+class MatchRequestHandler(BaseHTTPRequestHandler):
+
+    def address_string(self):
+        # unix domain socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.service.matcher.debug:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, obj: dict):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok', 'queued': self.server.service.jobs.qsize(), 'prefiltered': self.server.service.matcher.prefiltered})
+        elif self.path == '/stats' and self.server.service.stats:
+            self.send_json(200, self.server.service.stats.summary(self.server.service.matched))
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/match':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise ValueError("negative Content-Length")
+        except ValueError as e:
+            self.send_json(400, {'error': 'bad request: %s' % e})
+            return
+        body = self.rfile.read(length)
+
+        paths = []
+        images = []
+        rois = None
+        if self.headers.get('Content-Type', '').startswith('image/'):
+            images.append(body)
+        else:
+            try:
+                request = json.loads(body)
+                paths = request.get('paths', [])
+                rois = request.get('rois')
+            except (ValueError, AttributeError) as e:
+                self.send_json(400, {'error': 'bad request: %s' % e})
+                return
+
+        try:
+            results = self.server.service.match_batch(paths, images, rois)
+        except queue.Full:
+            self.send_json(503, {'error': 'work queue is full'})
+            return
+
+        self.send_json(200, {'results': results})
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service: MatchService, port=None, socket_path=None):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, MatchRequestHandler)
+    else:
+        # only listen on localhost, there is no authentication
+        server = ThreadingHTTPServer(('127.0.0.1', port), MatchRequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--template_dir", required=True, type=str, help="The directory of logo template images")
+    parser.add_argument("--bank_file", type=str, help="Precompiled template bank (.npz). Defaults to %s inside the template dir." % TEMPLATE_BANK_FILE)
+    parser.add_argument("--order_file", nargs='?', const=True, help="Try the templates in the order of this file written by templateorder.py (default: %s inside the template dir) and skip the templates it drops" % TEMPLATE_ORDER_FILE)
+    parser.add_argument("--cache", nargs='?', const=RESULT_CACHE_FILE, help="Cache results by screenshot content in this sqlite file (default: %s)" % RESULT_CACHE_FILE)
+    parser.add_argument("--pyramid", help="Coarse to fine search: match downsampled templates first and confirm candidates at full resolution", action="store_true")
+    parser.add_argument("--fft", help="Correlate all templates against one FFT of the screenshot instead of calling matchTemplate per template", action="store_true")
+    parser.add_argument("--prefilter", nargs='?', type=int, const=PREFILTER_MIN_PIXELS, help="Skip screenshots with fewer than this many brand colored pixels (default: %d) without matching them" % PREFILTER_MIN_PIXELS)
+    parser.add_argument("--multi", help="Report every location of every oauth provider instead of the first template that matches", action="store_true")
+    parser.add_argument("--scale_prior", help="Also try the templates at the scale of the logos found on each page, for zoomed screenshots (see templatematch.py --help for the cost)", action="store_true")
+    parser.add_argument("--tile_rows", nargs='?', type=int, const=TILE_ROWS, help="Match tall (full page) screenshots in overlapping strips of this many rows (default: %d) to bound memory" % TILE_ROWS)
+    parser.add_argument("--threads", type=int, default=1, help="Number of threads matching the oauth providers of one screenshot concurrently")
+    parser.add_argument("--workers", type=int, default=1, help="Number of screenshots matched concurrently")
+    parser.add_argument("--queue_size", type=int, default=64, help="Max number of queued screenshots before requests are rejected")
+    parser.add_argument("--queue_timeout", type=float, default=30.0, help="Seconds to wait for a free queue slot before rejecting a request")
+    parser.add_argument("--port", type=int, default=8080, help="Listen on this localhost port")
+    parser.add_argument("--socket", type=str, help="Listen on this unix domain socket instead of a port")
+    parser.add_argument("--stats", help="Time the stages, oauth providers and templates and serve the totals on GET /stats", action="store_true")
+    parser.add_argument("--debug", help="Increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.fft and args.pyramid:
+        parser.error("--fft and --pyramid can't be combined")
+    if args.scale_prior and args.multi:
+        parser.error("--scale_prior and --multi can't be combined")
+
+    result_cache = ResultCache(args.cache) if args.cache else None
+    matcher = TemplateMatcher(args.template_dir, bank_file=args.bank_file or True, pyramid=args.pyramid, result_cache=result_cache, threads=args.threads, fft=args.fft, order_file=args.order_file, prefilter_min_pixels=args.prefilter, tile_rows=args.tile_rows, multi=args.multi, scale_prior=args.scale_prior)
+    matcher.debug = args.debug
+    matcher.instrument = args.stats
+    if args.order_file:
+        if not matcher.template_order:
+            parser.error("could not read the template order file")
+        sys.stderr.write("template order: %d templates dropped as duplicates\n" % len(matcher.template_order.get('dropped', {})))
+
+    service = MatchService(matcher, workers=args.workers, queue_size=args.queue_size, queue_timeout=args.queue_timeout)
+    server = make_server(service, port=args.port, socket_path=args.socket)
+
+    sys.stderr.write("listening on %s\n" % (args.socket or "127.0.0.1:%d" % args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)